@@ -0,0 +1,49 @@
+from droplet_planning.connections import (extract_adjacent_paths,
+                                          extract_adjacent_paths_parallel,
+                                          get_adjacency_matrix)
+from droplet_planning.synthetic import LAYOUTS
+
+
+class ExtractAdjacentPaths(object):
+    params = (sorted(LAYOUTS), [10, 100, 1000, 10000])
+    param_names = ['layout', 'electrode_count']
+
+    def setup(self, layout, electrode_count):
+        self.df_paths = LAYOUTS[layout](electrode_count)
+
+    def time_extract_adjacent_paths(self, layout, electrode_count):
+        extract_adjacent_paths(self.df_paths)
+
+    def peakmem_extract_adjacent_paths(self, layout, electrode_count):
+        extract_adjacent_paths(self.df_paths)
+
+
+class ExtractAdjacentPathsParallel(object):
+    params = ([10000, 100000], [1, 2, 4])
+    param_names = ['electrode_count', 'max_workers']
+
+    def setup(self, electrode_count, max_workers):
+        self.df_paths = LAYOUTS['square'](electrode_count)
+
+    def time_extract_adjacent_paths_parallel(self, electrode_count,
+                                             max_workers):
+        extract_adjacent_paths_parallel(self.df_paths,
+                                        max_workers=max_workers)
+
+
+class GetAdjacencyMatrix(object):
+    # __NB__ Dense matrix for 10,000 electrodes uses 800 MB.
+    params = ([10, 100, 1000, 10000], [False, True])
+    param_names = ['electrode_count', 'sparse']
+
+    def setup(self, electrode_count, sparse):
+        if electrode_count > 1000 and not sparse:
+            raise NotImplementedError
+        self.df_connected = \
+            extract_adjacent_paths(LAYOUTS['square'](electrode_count))
+
+    def time_get_adjacency_matrix(self, electrode_count, sparse):
+        get_adjacency_matrix(self.df_connected, sparse=sparse)
+
+    def peakmem_get_adjacency_matrix(self, electrode_count, sparse):
+        get_adjacency_matrix(self.df_connected, sparse=sparse)
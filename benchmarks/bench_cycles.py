@@ -0,0 +1,93 @@
+import numpy as np
+
+from droplet_planning.connections import (extract_adjacent_paths,
+                                          get_adjacency_matrix)
+from droplet_planning.cycles import (find_cycle_anneal, find_cycle_anytime,
+                                     find_cycle_enumerate,
+                                     find_cycle_population)
+from droplet_planning.synthetic import LAYOUTS, grid_shape
+
+
+def grid_block(block_rows, block_columns, electrode_count=400,
+               layout='square'):
+    '''
+    Return `(nodes, adjacency_matrix)`, where `nodes` are the indexes of the
+    electrodes in the top-left `block_rows` by `block_columns` block of a
+    grid of electrodes (see `synthetic.LAYOUTS`).
+
+    For a square grid, a cycle through the block exists if either block
+    dimension is even.  Each electrode of a hexagonal grid has up to six
+    neighbours.
+    '''
+    rows, columns = grid_shape(electrode_count)
+    df_connected = extract_adjacent_paths(LAYOUTS[layout](electrode_count))
+    adjacency_matrix, indexed_paths, path_indexes = \
+        get_adjacency_matrix(df_connected)
+    path_ids = ['electrode%03d' % (i * columns + j)
+                for i in xrange(block_rows) for j in xrange(block_columns)]
+    return path_indexes[path_ids].values, adjacency_matrix
+
+
+class FindCycleEnumerate(object):
+    params = (['square', 'hex'], [(2, 3), (2, 4), (4, 4), (6, 6), (5, 8),
+                                  (2, 20)])
+    param_names = ['layout', 'block_shape']
+
+    def setup(self, layout, block_shape):
+        self.nodes, self.adjacency_matrix = grid_block(*block_shape,
+                                                       layout=layout)
+
+    def time_find_cycle_enumerate(self, layout, block_shape):
+        find_cycle_enumerate(self.nodes, self.adjacency_matrix)
+
+    def peakmem_find_cycle_enumerate(self, layout, block_shape):
+        find_cycle_enumerate(self.nodes, self.adjacency_matrix)
+
+
+class FindCycleAnneal(object):
+    params = [(2, 3), (2, 4), (4, 4)]
+    param_names = ['block_shape']
+    timeout = 300
+
+    def setup(self, block_shape):
+        self.nodes, self.adjacency_matrix = grid_block(*block_shape)
+
+    def time_find_cycle_anneal(self, block_shape):
+        find_cycle_anneal(self.nodes, self.adjacency_matrix,
+                          random_state=np.random.RandomState(0))
+
+    def peakmem_find_cycle_anneal(self, block_shape):
+        find_cycle_anneal(self.nodes, self.adjacency_matrix,
+                          random_state=np.random.RandomState(0))
+
+
+class FindCyclePopulation(object):
+    params = [(4, 4), (6, 6), (6, 8), (8, 8)]
+    param_names = ['block_shape']
+    timeout = 300
+
+    def setup(self, block_shape):
+        self.nodes, self.adjacency_matrix = grid_block(*block_shape)
+
+    def time_find_cycle_population(self, block_shape):
+        find_cycle_population(self.nodes, self.adjacency_matrix,
+                              random_state=np.random.RandomState(0))
+
+    def peakmem_find_cycle_population(self, block_shape):
+        find_cycle_population(self.nodes, self.adjacency_matrix,
+                              random_state=np.random.RandomState(0))
+
+
+class FindCycleAnytime(object):
+    params = ([(6, 6), (8, 8), (10, 10)], [5, 50, 500])
+    param_names = ['block_shape', 'deadline_ms']
+    timeout = 300
+
+    def setup(self, block_shape, deadline_ms):
+        self.nodes, self.adjacency_matrix = grid_block(*block_shape)
+
+    def track_broken_edges(self, block_shape, deadline_ms):
+        cycle, score, broken_edges = \
+            find_cycle_anytime(self.nodes, self.adjacency_matrix, deadline_ms,
+                               random_state=np.random.RandomState(0))
+        return len(broken_edges)
@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+
+from droplet_planning.device import DeviceFrames, svg_polygons_to_frames
+from droplet_planning.synthetic import LAYOUTS, paths_to_svg
+
+ELECTRODE_COUNTS = [10, 100, 1000, 10000]
+# __NB__ The route table (see `DeviceFrames.build_route_table`) is two dense
+# `int16` arrays of size $n^2$, i.e., 400 MB for 10,000 electrodes.
+ROUTE_TABLE_MAX_COUNT = 1000
+
+
+class _DeviceSvg(object):
+    params = (sorted(LAYOUTS), ELECTRODE_COUNTS)
+    param_names = ['layout', 'electrode_count']
+
+    def setup(self, layout, electrode_count):
+        self.temp_dir = tempfile.mkdtemp(prefix='droplet-planning-')
+        self.svg_path = os.path.join(self.temp_dir, 'device.svg')
+        paths_to_svg(LAYOUTS[layout](electrode_count), self.svg_path)
+
+    def teardown(self, layout, electrode_count):
+        shutil.rmtree(self.temp_dir)
+
+
+class ReadSvg(_DeviceSvg):
+    def time_svg_polygons_to_frames(self, layout, electrode_count):
+        svg_polygons_to_frames(self.svg_path)
+
+    def peakmem_svg_polygons_to_frames(self, layout, electrode_count):
+        svg_polygons_to_frames(self.svg_path)
+
+
+class DeviceFramesInit(_DeviceSvg):
+    def time_init(self, layout, electrode_count):
+        DeviceFrames(self.svg_path)
+
+    def peakmem_init(self, layout, electrode_count):
+        DeviceFrames(self.svg_path)
+
+    def time_init_route_table(self, layout, electrode_count):
+        if electrode_count > ROUTE_TABLE_MAX_COUNT:
+            raise NotImplementedError
+        DeviceFrames(self.svg_path, route_table=True)
+
+    def peakmem_init_route_table(self, layout, electrode_count):
+        if electrode_count > ROUTE_TABLE_MAX_COUNT:
+            raise NotImplementedError
+        DeviceFrames(self.svg_path, route_table=True)
+
+
+class DeviceFramesLoad(_DeviceSvg):
+    def setup(self, layout, electrode_count):
+        super(DeviceFramesLoad, self).setup(layout, electrode_count)
+        self.artifact_path = os.path.join(self.temp_dir, 'device.npz')
+        DeviceFrames(self.svg_path).save(self.artifact_path)
+
+    def time_load(self, layout, electrode_count):
+        DeviceFrames.load(self.artifact_path)
+
+    def peakmem_load(self, layout, electrode_count):
+        DeviceFrames.load(self.artifact_path)
+
+
+class FindPath(_DeviceSvg):
+    params = ([False, True], ELECTRODE_COUNTS)
+    param_names = ['route_table', 'electrode_count']
+
+    def setup(self, route_table, electrode_count):
+        if route_table and electrode_count > ROUTE_TABLE_MAX_COUNT:
+            raise NotImplementedError
+        super(FindPath, self).setup('square', electrode_count)
+        self.device = DeviceFrames(self.svg_path, route_table=route_table)
+        # Route between opposite corners of the grid.
+        self.source_id, self.target_id = \
+            self.device.indexed_paths.values[[0, -1]]
+
+    def teardown(self, route_table, electrode_count):
+        super(FindPath, self).teardown('square', electrode_count)
+
+    def time_find_path(self, route_table, electrode_count):
+        self.device.find_path(self.source_id, self.target_id)
+
+    def time_path_length(self, route_table, electrode_count):
+        self.device.path_length(self.source_id, self.target_id)
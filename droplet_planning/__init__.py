@@ -1 +1,60 @@
 # coding: utf-8
+import importlib
+import sys
+import types
+
+
+# Public names, by the submodule defining them.  Submodules are only
+# imported on first access to one of their names, so importing the package
+# stays fast (e.g., for worker processes which never plot).
+_LAZY_ATTRIBUTES = {'DeviceFrames': 'device',
+                    'ChannelIndex': 'actuation',
+                    'CycleCache': 'cycles',
+                    'NoCycleError': 'cycles',
+                    'check_cycle_feasible': 'cycles',
+                    'find_cycle_anneal': 'cycles',
+                    'find_cycle_anneal_parallel': 'cycles',
+                    'find_cycle_anytime': 'cycles',
+                    'find_cycle_backtrack': 'cycles',
+                    'find_cycle_enumerate': 'cycles',
+                    'find_cycle_population': 'cycles',
+                    'find_tour': 'tours',
+                    'plan_moves': 'planning'}
+
+__all__ = sorted(_LAZY_ATTRIBUTES)
+
+
+class _LazyModule(types.ModuleType):
+    '''
+    Package module which imports the submodule defining a public name on
+    first access to the name.
+    '''
+    def __getattr__(self, name):
+        try:
+            module_name = _LAZY_ATTRIBUTES[name]
+        except KeyError:
+            raise AttributeError("'module' object has no attribute '%s'" %
+                                 name)
+        value = getattr(importlib.import_module('.' + module_name,
+                                                self.__name__), name)
+        setattr(self, name, value)
+        return value
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(_LAZY_ATTRIBUTES))
+
+
+def _install_lazy_module():
+    # Replace this module in `sys.modules` with a lazy module sharing the
+    # same attributes.  (Python 2 modules do not support module-level
+    # `__getattr__` or assigning `__class__`.)
+    module = sys.modules[__name__]
+    lazy_module = _LazyModule(__name__)
+    lazy_module.__dict__.update(module.__dict__)
+    # Keep reference to the original module, since the globals of a module
+    # are cleared once the module is garbage collected.
+    lazy_module._module = module
+    sys.modules[__name__] = lazy_module
+
+
+_install_lazy_module()
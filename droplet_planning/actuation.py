@@ -0,0 +1,153 @@
+import itertools
+
+import numpy as np
+
+# __NB__ On Python 2, `pandas` imports `matplotlib`, which is slow to import,
+# so `pandas` is only imported by the functions which use it.
+
+
+class ChannelIndex(object):
+    '''
+    Map from electrode ids to actuation channels, stored as [compressed
+    sparse row (CSR)][1] arrays, i.e., the channels of electrode $i$ are
+    `channels[indptr[i]:indptr[i + 1]]`.
+
+    Compiles electrode routes into bit-packed channel actuation frames.  Each
+    frame holds one bit per channel, packed with `numpy.packbits`, i.e., bit
+    `0x80 >> (channel % 8)` of byte `channel // 8`.  Use
+    `numpy.unpackbits(frames, axis=-1)[..., :channel_count]` to unpack a
+    frame (or matrix of frames) to boolean channel states.
+
+    [1]: https://en.wikipedia.org/wiki/Sparse_matrix#Compressed_sparse_row_(CSR,_CRS_or_Yale_format)
+    '''
+    def __init__(self, electrode_channels, channel_count=None):
+        '''
+        Arguments
+        ---------
+
+         - `electrode_channels`: Series mapping each electrode id to a list of
+           channels (see `device.svg_polygons_to_channels`).
+         - `channel_count`: Number of channels in each frame (default: highest
+           channel plus one).
+        '''
+        import pandas as pd
+
+        counts = np.array([len(c) for c in electrode_channels], dtype=int)
+        self.electrode_ids = pd.Index(electrode_channels.index)
+        self.indptr = np.concatenate([[0], np.cumsum(counts)]).astype(int)
+        self.channels = np.array([c_ij for c in electrode_channels
+                                  for c_ij in c], dtype=int)
+        if channel_count is None:
+            channel_count = (self.channels.max() + 1
+                             if self.channels.shape[0] else 0)
+        elif self.channels.shape[0] and self.channels.max() >= channel_count:
+            raise ValueError('Channel %d out of range for %d channels.' %
+                             (self.channels.max(), channel_count))
+        self.channel_count = int(channel_count)
+        self.frame_size = (self.channel_count + 7) // 8
+        self._electrode_frames = None
+
+    def electrode_indexes(self, electrode_ids):
+        '''
+        Return array of positions of electrodes in the index.
+
+        Raises `KeyError` for unknown electrode ids.
+        '''
+        indexes = self.electrode_ids.get_indexer(electrode_ids)
+        if (indexes < 0).any():
+            unknown = np.asarray(electrode_ids, dtype=object)[indexes < 0]
+            raise KeyError('Unknown electrodes: %s' %
+                           ', '.join(map(str, unknown)))
+        return indexes
+
+    def electrode_to_channels(self, electrode_id):
+        '''
+        Return array of channels of electrode.
+        '''
+        i = self.electrode_indexes([electrode_id])[0]
+        return self.channels[self.indptr[i]:self.indptr[i + 1]]
+
+    @property
+    def electrode_frames(self):
+        '''
+        Bit-packed `(electrodes, frame_size)` matrix of the frame actuating
+        each electrode (computed on first access).
+        '''
+        if self._electrode_frames is None:
+            counts = np.diff(self.indptr)
+            rows = np.repeat(np.arange(counts.shape[0]), counts)
+            frames = np.zeros((counts.shape[0], self.frame_size),
+                              dtype=np.uint8)
+            np.bitwise_or.at(frames, (rows, self.channels >> 3),
+                             (0x80 >> (self.channels & 7)).astype(np.uint8))
+            self._electrode_frames = frames
+        return self._electrode_frames
+
+    def _pack(self, electrode_ids, step_counts):
+        # Combine frames of the electrodes in each step.
+        frames = self.electrode_frames[self.electrode_indexes(electrode_ids)]
+        step_counts = np.asarray(step_counts, dtype=int)
+        if (step_counts == 1).all():
+            return frames
+        packed = np.zeros((step_counts.shape[0], self.frame_size),
+                          dtype=np.uint8)
+        non_empty = step_counts > 0
+        if non_empty.any():
+            starts = (np.cumsum(step_counts) - step_counts)[non_empty]
+            packed[non_empty] = np.bitwise_or.reduceat(frames, starts, axis=0)
+        return packed
+
+    def compile_steps(self, steps):
+        '''
+        Return bit-packed `(steps, frame_size)` actuation matrix, where each
+        step is a list of electrode ids to actuate together.
+        '''
+        steps = list(steps)
+        return self._pack([e for step_i in steps for e in step_i],
+                          [len(step_i) for step_i in steps])
+
+    def compile_path(self, path):
+        '''
+        Return bit-packed actuation matrix with one step for each electrode
+        along `path` (e.g., as returned by `DeviceFrames.find_path`).
+        '''
+        return self._pack(path, np.ones(len(path), dtype=int))
+
+    def compile_cycle(self, cycle, repeat=1):
+        '''
+        Return bit-packed actuation matrix for `repeat` passes around
+        `cycle` (e.g., as returned by `cycles.find_cycle_anneal`).
+        '''
+        return self.compile_path(list(cycle) * repeat)
+
+    def compile_routes(self, routes):
+        '''
+        Return bit-packed actuation matrix for moving several droplets along
+        `routes` at the same time, one electrode per droplet per step.
+
+        Each droplet stays on the last electrode of its route once its route
+        is finished, i.e., the number of steps is the length of the longest
+        route.
+        '''
+        lengths = np.array([len(route_i) for route_i in routes], dtype=int)
+        step_count = lengths.max() if lengths.shape[0] else 0
+        # Pad each route with its last electrode, in step order.
+        electrode_ids = [route_i[min(k, len(route_i) - 1)]
+                         for k in xrange(step_count) for route_i in routes]
+        return self._pack(electrode_ids, np.repeat(lengths.shape[0],
+                                                   step_count))
+
+    def iter_frames(self, steps, chunk_size=1024):
+        '''
+        Generate bit-packed frame for each step (a list of electrode ids).
+
+        Steps are consumed and compiled `chunk_size` at a time, so `steps`
+        may be a generator for a protocol too long to hold in memory.
+        '''
+        steps = iter(steps)
+        while True:
+            chunk = list(itertools.islice(steps, chunk_size))
+            if not chunk:
+                break
+            for frame_i in self.compile_steps(chunk):
+                yield frame_i
@@ -1,9 +1,11 @@
 # coding: utf-8
 # Copyright 2015
 # Jerry Zhou <jerryzhou@hotmail.ca> and Christian Fobel <christian@fobel.net>
-import pandas as pd
 import numpy as np
 
+# __NB__ On Python 2, `pandas` imports `matplotlib`, which is slow to import,
+# so `pandas` is only imported by the functions which use it.
+
 
 def extend_paths(df, axis, distance):
     '''
@@ -17,6 +19,110 @@ def extend_paths(df, axis, distance):
     return df_scaled
 
 
+def get_path_bounds(df_paths, extend=.5):
+    '''
+    Return bounding box of each polygon path, both as drawn and with outline
+    extended away from the polygon center point by `extend` units along each
+    axis (see `extend_paths`).
+
+    Returns
+    -------
+
+    `pandas.DataFrame` indexed by `path_id` (in order of first appearance in
+    `df_paths`), with the following columns:
+
+     - `xmin`, `xmax`, `ymin`, `ymax`: Bounding box of path outline.
+     - `xmin_x`, `xmax_x`: x-bounds of outline extended along x-axis.
+     - `ymin_y`, `ymax_y`: y-bounds of outline extended along y-axis.
+    '''
+    import pandas as pd
+
+    codes, path_ids = pd.factorize(df_paths['path_id'])
+
+    def extended(axis):
+        # Vectorized equivalent of `extend_paths(df_paths, axis, extend)`.
+        offsets = df_paths[axis + '_center_offset'].values
+        offsets = np.where(offsets < 0, offsets - extend, offsets + extend)
+        return df_paths[axis + '_center'].values + offsets
+
+    df_coords = pd.DataFrame({'x': df_paths['x'].values,
+                              'y': df_paths['y'].values,
+                              'x_x': extended('x'), 'y_y': extended('y')})
+    df_bounds = df_coords.groupby(codes).agg(['min', 'max'])
+    df_bounds.columns = ['%s%s%s' % (c[0][0], c[1], c[0][1:])
+                         for c in df_bounds.columns]
+    df_bounds.index = path_ids
+    df_bounds.index.name = 'path_id'
+    return df_bounds[['xmin', 'xmax', 'ymin', 'ymax', 'xmin_x', 'xmax_x',
+                      'ymin_y', 'ymax_y']]
+
+
+def find_overlapping_boxes(query, boxes):
+    '''
+    Find all pairs of overlapping (closed) bounding boxes.
+
+    Boxes are binned by their lower-left corner on a uniform grid with a cell
+    size just larger than the largest box dimension, so the boxes overlapping
+    any query box are found by looking up the 3x3 block of grid cells around
+    the query corner.  The lookup is a single sort and `searchsorted` pass,
+    i.e., $O(n \log n)$ for boxes of similar size.
+
+    Arguments
+    ---------
+
+     - `query`, `boxes`: `(n, 4)` arrays of `xmin, xmax, ymin, ymax` rows.
+
+    Returns
+    -------
+
+    Arrays `(i, j)` of indexes such that `query[i]` overlaps `boxes[j]`.
+    '''
+    query = np.asarray(query, dtype=float)
+    boxes = np.asarray(boxes, dtype=float)
+    if not query.shape[0] or not boxes.shape[0]:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+
+    all_boxes = np.concatenate([query, boxes])
+    cell_size = 1.01 * max((all_boxes[:, 1] - all_boxes[:, 0]).max(),
+                           (all_boxes[:, 3] - all_boxes[:, 2]).max())
+    if not cell_size > 0:
+        cell_size = 1.
+    origin = all_boxes[:, [0, 2]].min(axis=0)
+
+    # Pad cell coordinates by one so neighbouring cells are non-negative.
+    query_cells = (np.floor((query[:, [0, 2]] - origin) / cell_size)
+                   .astype(np.int64) + 1)
+    box_cells = (np.floor((boxes[:, [0, 2]] - origin) / cell_size)
+                 .astype(np.int64) + 1)
+    stride = max(query_cells[:, 1].max(), box_cells[:, 1].max()) + 2
+
+    box_keys = box_cells[:, 0] * stride + box_cells[:, 1]
+    box_order = np.argsort(box_keys, kind='mergesort')
+    sorted_keys = box_keys[box_order]
+
+    i_frames = []
+    j_frames = []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            keys = (query_cells[:, 0] + dx) * stride + query_cells[:, 1] + dy
+            start = np.searchsorted(sorted_keys, keys, side='left')
+            counts = np.searchsorted(sorted_keys, keys, side='right') - start
+            total = counts.sum()
+            if not total:
+                continue
+            # Expand each `[start, start + count)` range of sorted boxes.
+            offsets = np.repeat(start - np.cumsum(counts) + counts, counts)
+            i_frames.append(np.repeat(np.arange(query.shape[0]), counts))
+            j_frames.append(box_order[offsets + np.arange(total)])
+    if not i_frames:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    i = np.concatenate(i_frames)
+    j = np.concatenate(j_frames)
+    overlap = ((boxes[j, 0] <= query[i, 1]) & (boxes[j, 1] >= query[i, 0]) &
+               (boxes[j, 2] <= query[i, 3]) & (boxes[j, 3] >= query[i, 2]))
+    return i[overlap], j[overlap]
+
+
 def extract_adjacent_paths(df_paths, extend=.5):
     '''
     Generate list of connections between "adjacent" polygon paths based on
@@ -28,65 +134,281 @@ def extract_adjacent_paths(df_paths, extend=.5):
      - `df_paths`: Table of polygon path vertices (one row per vertex).
          * Table rows with the same value in the `path_id` column are grouped
            together as a polygon.
+     - `extend`: Absolute distance to extend each polygon outline by when
+       testing for adjacency.
+
+    __NB__, candidate neighbours are found using a bounding box grid index
+    (see `find_overlapping_boxes`), so the runtime is roughly $O(n \log n)$
+    in the number of paths rather than $O(n^2)$.
+    '''
+    df_bounds = get_path_bounds(df_paths, extend)
+    bounds = df_bounds.values
+    source, target = _get_adjacent_pairs(bounds, _get_extended_boxes(bounds))
+    return _get_connections_frame(df_bounds.index.values, source, target)
+
+
+def extract_adjacent_paths_parallel(df_paths, extend=.5, tile_count=None,
+                                    max_workers=None):
+    '''
+    Tiled, multi-process equivalent of `extract_adjacent_paths`, e.g., for
+    devices with many thousands of electrodes.
+
+    The device plane is split into vertical tiles, with about the same
+    number of path centers in each tile.  Each tile is processed by a
+    worker process, which computes the bounds of the paths centered in the
+    tile and of all paths within reach of their extended outlines (i.e.,
+    tiles overlap by the `extend` margin plus the size of a path), and tests
+    the paths centered in the tile for adjacency.  The path vertex arrays
+    are shared with the workers through shared memory, rather than copied
+    for each tile.
+
+    The result is identical to `extract_adjacent_paths`.  Each worker
+    removes duplicate connections found within its tile, and connections
+    found in neighbouring tiles are then merged without duplicates.
+
+    __NB__, each path is assumed to have a single `x_center` and `y_center`
+    (i.e., the same values on each of its vertices), as computed by
+    `svg_model.compute_shape_centers`.
+
+    Arguments
+    ---------
+
+     - `df_paths`, `extend`: See `extract_adjacent_paths`.
+     - `tile_count`: Number of tiles (default: four per worker).
+     - `max_workers`: Number of worker processes (default: number of CPUs).
+       If 1, connections are extracted in this process.
+    '''
+    import multiprocessing
+    from multiprocessing.sharedctypes import RawArray
+    import pandas as pd
+
+    if max_workers is None:
+        max_workers = multiprocessing.cpu_count()
+    if max_workers <= 1:
+        return extract_adjacent_paths(df_paths, extend)
+    if tile_count is None:
+        tile_count = 4 * max_workers
+
+    codes, path_ids = pd.factorize(df_paths['path_id'])
+    columns = [codes.astype(float)] + [df_paths[column_i].values
+                                       .astype(float)
+                                       for column_i in _TILE_COLUMNS[1:]]
+    x, x_center, x_offset = columns[1:4]
+
+    # A path bounding box (extended or not) is within `reach` of the path
+    # center along the x-axis, so the bounds of paths with centers more
+    # than twice `reach` apart do not overlap.
+    reach = (max(np.abs(x - x_center).max(), np.abs(x_offset).max())
+             if x.shape[0] else 0) + abs(extend)
+    # Tile edges at quantiles of the path center x-coordinates.
+    edges = (np.percentile(x_center, np.linspace(0, 100, tile_count +
+                                                 1)[1:-1])
+             if x_center.shape[0] else [])
+    edges = np.unique(np.concatenate([[-np.inf], edges, [np.inf]]))
+    tiles = [(x0, x1, 2 * reach, extend)
+             for x0, x1 in zip(edges[:-1], edges[1:])]
+
+    shared_arrays = []
+    for array_i in columns:
+        shared_i = RawArray('d', array_i.size)
+        np.frombuffer(shared_i)[:] = array_i
+        shared_arrays.append(shared_i)
+
+    pool = multiprocessing.Pool(max_workers, initializer=_init_tile_worker,
+                                initargs=shared_arrays)
+    try:
+        pairs = pool.map(_get_tile_pairs, tiles)
+    finally:
+        pool.close()
+        pool.join()
+    source = np.concatenate([[]] + [i for i, j in pairs]).astype(int)
+    target = np.concatenate([[]] + [j for i, j in pairs]).astype(int)
+    return _get_connections_frame(path_ids.values, source, target)
+
+
+# Vertex columns shared with tile worker processes, starting with the path
+# codes (see `_init_tile_worker`).
+_TILE_COLUMNS = ['path_code', 'x', 'x_center', 'x_center_offset', 'y',
+                 'y_center', 'y_center_offset']
+_tile_arrays = None
+
+
+def _init_tile_worker(*shared_arrays):
+    global _tile_arrays
+
+    _tile_arrays = [np.frombuffer(shared_i) for shared_i in shared_arrays]
+
+
+def _get_tile_pairs(tile):
     '''
-    # Find corners of each solid path outline.
-    df_scaled_x = extend_paths(df_paths, 'x', extend)  # Extend x coords by abs units
-    df_scaled_y = extend_paths(df_paths, 'y', extend)  # Extend y coords by abs units
-
-    df_corners = df_paths.groupby('path_id').agg({'x': ['min', 'max'],
-                                                  'y': ['min', 'max'], })
-
-    # Find adjacent electrodes
-    row_list = []
-
-    for pathNumber in df_paths['path_id'].drop_duplicates():
-        df_stretched = df_scaled_x[df_scaled_x.path_id.isin([pathNumber])]
-        xmin_x, xmax_x, ymin_x, ymax_x = (df_stretched.x.min(),
-                                          df_stretched.x.max(),
-                                          df_stretched.y.min(),
-                                          df_stretched.y.max())
-        df_stretched = df_scaled_y[df_scaled_y.path_id.isin([pathNumber])]
-        xmin_y, xmax_y, ymin_y, ymax_y = (df_stretched.x.min(),
-                                          df_stretched.x.max(),
-                                          df_stretched.y.min(),
-                                          df_stretched.y.max())
-
-        #Some conditions unnecessary if it is assumed that electrodes don't overlap
-        adjacent = df_corners[
-            ((df_corners.x['min'] < xmax_x) & (df_corners.x['max'] >= xmax_x)
-            # Check in x stretched direction
-            |(df_corners.x['min'] < xmin_x) & (df_corners.x['max'] >= xmin_x))
-            # Check if y is within bounds
-            & (df_corners.y['min'] < ymax_x) & (df_corners.y['max'] > ymin_x) |
-
-            #maybe do ymax_x - df_corners.y['min'] > threshold &
-            #  df_corners.y['max'] - ymin_x > threshold
-
-            ((df_corners.y['min'] < ymax_y) & (df_corners.y['max'] >= ymax_y)
-             # Checks in y stretched direction
-             |(df_corners.y['min'] < ymin_y) & (df_corners.y['max'] >= ymin_y))
-             # Check if x in within bounds
-            & ((df_corners.x['min'] < xmax_y) & (df_corners.x['max'] > xmin_y))
-        ].index.values
-
-        for path in adjacent:
-            temp_dict = {}
-            reverse_dict = {}
-
-            temp_dict ['source'] = pathNumber
-            reverse_dict['source'] = path
-            temp_dict ['target'] = path
-            reverse_dict['target'] = pathNumber
-
-            if(reverse_dict not in row_list):
-                row_list.append(temp_dict)
-
-    df_connected = (pd.DataFrame(row_list)[['source', 'target']]
-                    .sort(axis=1, ascending=False).sort(['source', 'target']))
-    return df_connected
-
-
-def get_adjacency_matrix(df_connected):
+    Return adjacent `(source, target)` path codes (without duplicate
+    connections) for the sources centered in the x-range of `tile` (using
+    the vertex arrays shared with the worker).
+    '''
+    x0, x1, reach, extend = tile
+    codes, x, x_center, x_offset, y, y_center, y_offset = _tile_arrays
+    # Vertices of paths which may overlap paths centered in the tile.
+    selected = np.flatnonzero((x_center >= x0 - reach) &
+                              (x_center <= x1 + reach))
+    if not selected.shape[0]:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+
+    def extended(center, offsets):
+        # See `get_path_bounds`.
+        offsets = offsets[selected]
+        return center[selected] + np.where(offsets < 0, offsets - extend,
+                                           offsets + extend)
+
+    path_codes, bounds = _get_code_bounds(codes[selected].astype(int),
+                                          [x[selected], y[selected],
+                                           extended(x_center, x_offset),
+                                           extended(y_center, y_offset),
+                                           x_center[selected]])
+    # Last two columns are the (single) center of each path.
+    centers = bounds[:, 8]
+    bounds = bounds[:, :8]
+    query = np.flatnonzero((centers >= x0) & (centers < x1))
+    if not query.shape[0]:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    i, j = _get_adjacent_pairs(bounds, _get_extended_boxes(bounds), query,
+                               np.arange(bounds.shape[0]))
+    return _deduplicate_pairs(path_codes[i], path_codes[j])
+
+
+def _get_code_bounds(codes, coordinates):
+    '''
+    Return `(path_codes, bounds)`, where `bounds` has minimum and maximum
+    columns for each of the vertex `coordinates` arrays (in sorted order of
+    path code), e.g., the same columns as `get_path_bounds` for `x`, `y`,
+    extended `x` and extended `y` vertex coordinates.
+    '''
+    order = np.argsort(codes, kind='mergesort')
+    codes = codes[order]
+    starts = np.flatnonzero(np.concatenate([[True],
+                                            codes[1:] != codes[:-1]]))
+    columns = []
+    for values in coordinates:
+        values = values[order]
+        columns.extend([np.minimum.reduceat(values, starts),
+                        np.maximum.reduceat(values, starts)])
+    return codes[starts], np.column_stack(columns)
+
+
+def _get_extended_boxes(bounds):
+    '''
+    Return `(n, 4)` array of `xmin, xmax, ymin, ymax` bounding boxes of the
+    fully extended outline of each path (see `get_path_bounds`).
+    '''
+    xmin, xmax, ymin, ymax, xmin_x, xmax_x, ymin_y, ymax_y = bounds.T
+    return np.column_stack([np.minimum(xmin, xmin_x),
+                            np.maximum(xmax, xmax_x),
+                            np.minimum(ymin, ymin_y),
+                            np.maximum(ymax, ymax_y)])
+
+
+def _get_adjacent_pairs(bounds, extended, query=None, boxes=None):
+    '''
+    Return arrays `(i, j)` of indexes of adjacent paths, where path `i` is
+    one of the `query` paths and path `j` is one of the `boxes` paths
+    (default: all paths).
+
+    Arguments
+    ---------
+
+     - `bounds`: Array of `get_path_bounds` values.
+     - `extended`: Extended bounding boxes (see `_get_extended_boxes`).
+    '''
+    xmin, xmax, ymin, ymax, xmin_x, xmax_x, ymin_y, ymax_y = bounds.T
+
+    # Only paths overlapping the fully extended outline of a path can be
+    # adjacent to it.
+    if query is None:
+        i, j = find_overlapping_boxes(extended, bounds[:, :4])
+    else:
+        i, j = find_overlapping_boxes(extended[query], bounds[boxes, :4])
+        i, j = query[i], boxes[j]
+
+    #Some conditions unnecessary if it is assumed that electrodes don't overlap
+    adjacent = ((((xmin[j] < xmax_x[i]) & (xmax[j] >= xmax_x[i]))
+                 # Check in x stretched direction
+                 | ((xmin[j] < xmin_x[i]) & (xmax[j] >= xmin_x[i])))
+                # Check if y is within bounds
+                & (ymin[j] < ymax[i]) & (ymax[j] > ymin[i]) |
+                (((ymin[j] < ymax_y[i]) & (ymax[j] >= ymax_y[i]))
+                 # Checks in y stretched direction
+                 | ((ymin[j] < ymin_y[i]) & (ymax[j] >= ymin_y[i])))
+                # Check if x in within bounds
+                & ((xmin[j] < xmax[i]) & (xmax[j] > xmin[i])))
+    return i[adjacent], j[adjacent]
+
+
+def _get_connections_frame(path_ids, source, target):
+    '''
+    Return `extract_adjacent_paths` table of connections from arrays of
+    adjacent `(source, target)` path indexes (into `path_ids`).
+    '''
+    import pandas as pd
+
+    source, target = _deduplicate_pairs(source, target)
+
+    # Number connections by discovery order: by source path, then by sorted
+    # target path id.
+    n = path_ids.shape[0]
+    sorted_rank = np.empty(n, dtype=int)
+    sorted_rank[np.argsort(path_ids, kind='mergesort')] = np.arange(n)
+    order = np.lexsort((sorted_rank[target], source))
+    source, target = source[order], target[order]
+
+    # Sort by path id, keeping the discovery order number as the index.
+    # Sorting by rank is equivalent to (and much faster than) sorting the
+    # path id columns.
+    order = np.lexsort((sorted_rank[target], sorted_rank[source]))
+    return pd.DataFrame({'source': path_ids[source[order]],
+                         'target': path_ids[target[order]]},
+                        columns=['target', 'source'], index=order)
+
+
+def _deduplicate_pairs(source, target):
+    '''
+    Remove duplicate connections (e.g., found from both ends) from arrays of
+    `(source, target)` path indexes.  Paths are numbered in order of first
+    appearance, so each connection keeps the direction it was first found
+    in.
+    '''
+    if not source.shape[0]:
+        return source, target
+    n = max(source.max(), target.max()) + 1
+    edge_keys = np.minimum(source, target) * n + np.maximum(source, target)
+    # The direction from the lower path index sorts first.
+    order = np.argsort(2 * edge_keys + (source > target), kind='mergesort')
+    edge_keys = edge_keys[order]
+    first = order[np.concatenate([[True], edge_keys[1:] != edge_keys[:-1]])]
+    return source[first], target[first]
+
+
+def get_path_indexes(df_connected):
+    '''
+    Return mapping (and reverse mapping) from original keys in
+    `df_connected` to zero-based integer index (in sorted key order), without
+    building an adjacency matrix.
+
+    Returns
+    -------
+
+    `(indexed_paths, path_indexes)`, as returned by `get_adjacency_matrix`.
+    '''
+    import pandas as pd
+
+    sorted_path_keys = np.unique(np.concatenate([df_connected['source']
+                                                 .values,
+                                                 df_connected['target']
+                                                 .values]))
+    indexed_paths = pd.Series(sorted_path_keys)
+    path_indexes = pd.Series(indexed_paths.index, index=sorted_path_keys)
+    return indexed_paths, path_indexes
+
+
+def get_adjacency_matrix(df_connected, sparse=False):
     '''
     Return matrix where $a_{i,j} = 1$ indicates polygon $i$ is connected to
     polygon $j$.
@@ -94,15 +416,38 @@ def get_adjacency_matrix(df_connected):
     Also, return mapping (and reverse mapping) from original keys in
     `df_connected` to zero-based integer index used for matrix rows and
     columns.
+
+    Arguments
+    ---------
+
+     - `df_connected`: Table of connections, with `source` and `target`
+       columns.
+     - `sparse`: If `True`, return adjacency matrix as a
+       `scipy.sparse.csr_matrix` rather than a dense `numpy` array.  Memory
+       usage is then proportional to the number of connections rather than
+       the square of the number of polygons.
     '''
-    sorted_path_keys = np.sort(np.unique(df_connected[['source', 'target']]
-                                         .values.ravel()))
-    indexed_paths = pd.Series(sorted_path_keys)
-    path_indexes = pd.Series(indexed_paths.index, index=sorted_path_keys)
+    source_keys = df_connected['source'].values
+    target_keys = df_connected['target'].values
+    indexed_paths, path_indexes = get_path_indexes(df_connected)
+    sorted_path_keys = path_indexes.index.values
+
+    # Map all keys to matrix indexes in a single pass.
+    i = np.searchsorted(sorted_path_keys, source_keys)
+    j = np.searchsorted(sorted_path_keys, target_keys)
+    shape = (sorted_path_keys.shape[0], ) * 2
+
+    if sparse:
+        from scipy.sparse import coo_matrix
 
-    adjacency_matrix = np.zeros((path_indexes.shape[0], ) * 2, dtype=int)
-    for i_key, j_key in df_connected[['source', 'target']].values:
-        i, j = path_indexes.loc[[i_key, j_key]]
+        rows = np.concatenate([i, j])
+        columns = np.concatenate([j, i])
+        adjacency_matrix = coo_matrix((np.ones(rows.shape[0], dtype=int),
+                                       (rows, columns)), shape=shape).tocsr()
+        # Duplicate entries (e.g., self-connections) are summed by `tocsr`.
+        adjacency_matrix.data[:] = 1
+    else:
+        adjacency_matrix = np.zeros(shape, dtype=int)
         adjacency_matrix[i, j] = 1
         adjacency_matrix[j, i] = 1
     return adjacency_matrix, indexed_paths, path_indexes
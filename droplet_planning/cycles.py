@@ -1,7 +1,36 @@
+import hashlib
 import itertools
+import json
+import math
+import os
+import time
 
 import numpy as np
 
+from .files import atomic_write
+from .lru import LruCache
+from .metrics import active_recorder, count, record
+
+
+class NoCycleError(ValueError):
+    '''
+    Raised when no cycle exists between nodes.
+
+    The `reason` attribute is one of:
+
+     - `'degree'`: A node has fewer than two neighbours among the nodes.
+     - `'disconnected'`: The nodes are not all connected to each other.
+     - `'cut_vertex'`: Removing a single node disconnects the other nodes.
+     - `'bipartite_imbalance'`: The nodes can be split into two colours
+       (e.g., a checkerboard pattern on a grid), with each connection
+       joining different colours, but the colour counts differ (e.g., for
+       an odd number of nodes).
+     - `'exhausted'`: An exhaustive search found no cycle.
+    '''
+    def __init__(self, message, reason=None):
+        super(NoCycleError, self).__init__(message)
+        self.reason = reason
+
 
 def test_p_fast(nodes, connections):
     '''
@@ -13,34 +42,450 @@ def test_p_fast(nodes, connections):
                itertools.izip(nodes, neighbour_nodes))
 
 
-def find_cycle_enumerate(nodes, connections, test_f=test_p_fast, findall=False):
+def find_cycle_enumerate(nodes, connections, test_f=test_p_fast, findall=False,
+                         precheck=True):
     '''
     Find a permutation of the provided list of node indexes that form a cycle
     based on the connections between nodes.
 
-    An exhaustive search is performed and a `ValueError` is raised if no cycle
-    exists between the provided nodes.
+    An exhaustive search is performed and a `NoCycleError` (a `ValueError`)
+    is raised if no cycle exists between the provided nodes.  For the
+    default `test_f`, cheap necessary conditions are tested first (see
+    `check_cycle_feasible`), unless `precheck` is `False`.  A custom `test_f`
+    may define connections differently, so it is never prechecked.
+
+    When the default `test_f` is used, the search is delegated to the much
+    faster `find_cycle_backtrack` function, which finds the same set of
+    cycles.
+
+    For a custom `test_f`, the number of permutations tested is recorded as
+    the `cycles.permutations_tested` counter (see `metrics.record`).  For the
+    default `test_f`, `find_cycle_backtrack` records the
+    `cycles.backtrack_steps` counter instead.
 
-    __NB__, The runtime of this algorithm is $O(n!)$, which becomes large
-    *really* quickly (i.e., for small values $n$).  This function is only
-    really practical for up to 10 nodes.
+    __NB__, For a custom `test_f`, the runtime of this algorithm is $O(n!)$,
+    which becomes large *really* quickly (i.e., for small values $n$).  In
+    this case, this function is only really practical for up to 10 nodes.
     '''
+    if precheck and test_f is test_p_fast:
+        try:
+            check_cycle_feasible(nodes, connections)
+        except NoCycleError:
+            if findall:
+                return []
+            raise
+    if test_f is test_p_fast:
+        return find_cycle_backtrack(nodes, connections, findall=findall,
+                                    precheck=False)
+
     solutions = []
-    for p in itertools.permutations(nodes[1:], len(nodes) - 1):
-        order = (nodes[0], ) + p
-        v_connected = test_f(order, connections)
-        if sum(v_connected) == nodes.size:
+    permutation_count = 0
+    try:
+        for p in itertools.permutations(nodes[1:], len(nodes) - 1):
+            order = (nodes[0], ) + p
+            permutation_count += 1
+            v_connected = test_f(order, connections)
+            if sum(v_connected) == nodes.size:
+                if not findall:
+                    return order
+                solutions.append(order)
+        else:  # No break
             if not findall:
-                return order
-            solutions.append(order)
-    else:  # No break
+                raise NoCycleError('No cycle exists between nodes.',
+                                   'exhausted')
+    finally:
+        count('cycles.permutations_tested', permutation_count)
+    return solutions
+
+
+def find_cycle_backtrack(nodes, connections, findall=False, precheck=True):
+    '''
+    Find a permutation of the provided list of node indexes that form a cycle
+    based on the connections between nodes.
+
+    A depth-first backtracking search is performed, starting from the most
+    constrained node and trying neighbours with the fewest onward options
+    first.  A branch is abandoned as soon as any unvisited node can no longer
+    be both entered and left, when any unvisited node is no longer reachable
+    from the current node, or (for bipartite graphs, e.g., grids) when the
+    unvisited nodes cannot alternate colours.  For symmetric connections, a
+    branch is also abandoned when removing a single node (an articulation
+    point) would separate unvisited nodes from both ends of the remaining
+    path.
+
+    Each cycle is rotated to start at the first node.  If `findall` is
+    `True`, all cycles are returned in the same order as by
+    `find_cycle_enumerate`.  The search is exhaustive, so a `NoCycleError`
+    (a `ValueError`) is raised if no cycle exists between the provided
+    nodes.  Unless `precheck` is `False`, cheap necessary conditions are
+    tested first (see `check_cycle_feasible`).
+
+    The number of partial permutations expanded is recorded as the
+    `cycles.backtrack_steps` counter (see `metrics.record`).
+
+    __NB__, The worst case runtime is still exponential.  On connected
+    subsets of 20-40 electrodes of square and hexagonal grids, the search
+    typically takes a few milliseconds, but there is no step or time budget
+    (see `find_cycle_anytime` for a deadline-bounded search).
+    '''
+    nodes = np.asarray(nodes)
+    node_count = nodes.shape[0]
+    if not node_count:
+        raise NoCycleError('No cycle exists between nodes.', 'exhausted')
+    connected = _connected_between(nodes, connections)
+    if node_count > 1:
+        # A node may only be revisited to close a single node cycle.
+        np.fill_diagonal(connected, False)
+    if precheck:
+        try:
+            _check_connected_feasible(connected)
+        except NoCycleError:
+            if findall:
+                return []
+            raise
+
+    # Bit masks (indexed by position in `nodes`) of the out-neighbours and
+    # in-neighbours of each node.
+    out_masks = [sum(1 << int(j) for j in np.flatnonzero(row))
+                 for row in connected]
+    in_masks = [sum(1 << int(i) for i in np.flatnonzero(column))
+                for column in connected.T]
+
+    # If the (undirected) graph between the nodes is bipartite, any path must
+    # alternate between the two colours, which bounds the colour counts of
+    # the unvisited nodes.
+    colour_mask = _bipartite_colour_mask(connected | connected.T)
+    symmetric = (connected == connected.T).all()
+
+    # Start from the most constrained node (the cycle is rotated to start
+    # at the first node afterwards).
+    start = int(np.argmin(connected.sum(axis=0) + connected.sum(axis=1)))
+    start_bit = 1 << start
+    solutions = []
+    order = [start]
+    step_count = [0]
+    neighbour_lists = [np.flatnonzero(row).tolist() for row in connected]
+
+    def path_feasible(current, unvisited):
+        # A path from the current node through the unvisited nodes to the
+        # start node stays connected after removing any node except where
+        # it splits the path in two: each part left after removing a node
+        # must contain the current or the start node.  Test using a
+        # depth-first search from the current node, which finds the parts
+        # separated by each node (i.e., the articulation points).
+        allowed = unvisited | start_bit | 1 << current
+        discovered = [-1] * node_count
+        low = [0] * node_count
+        has_start = [False] * node_count
+        discovered[current] = 0
+        time_i = 1
+        root_children = 0
+        stack = [(current, iter(neighbour_lists[current]))]
+        while stack:
+            node_i, neighbours = stack[-1]
+            for j in neighbours:
+                if not allowed >> j & 1:
+                    continue
+                if discovered[j] < 0:
+                    discovered[j] = low[j] = time_i
+                    time_i += 1
+                    has_start[j] = j == start
+                    stack.append((j, iter(neighbour_lists[j])))
+                    break
+                low[node_i] = min(low[node_i], discovered[j])
+            else:
+                stack.pop()
+                if not stack:
+                    break
+                parent = stack[-1][0]
+                low[parent] = min(low[parent], low[node_i])
+                has_start[parent] |= has_start[node_i]
+                if parent == current:
+                    # The current node is an end of the path, so removing
+                    # it must leave a single part.
+                    root_children += 1
+                    if root_children > 1:
+                        return False
+                elif low[node_i] >= discovered[parent] and not \
+                        has_start[node_i]:
+                    return False
+        # Every unvisited node (and the start node) must be reached.
+        return time_i == bin(allowed).count('1')
+
+    def search(current, unvisited):
+        step_count[0] += 1
+        if not unvisited:
+            if out_masks[current] & start_bit:
+                solutions.append(list(order))
+                return not findall
+            return False
+
+        # Each unvisited node must be entered from the current node or
+        # another unvisited node, and left to an unvisited node or the
+        # start node.
+        current_bit = 1 << current
+        available_in = unvisited | current_bit
+        available_out = unvisited | start_bit
+        candidates = out_masks[current] & unvisited
+        forced_next = 0
+        forced_last = 0
+        remaining = unvisited
+        while remaining:
+            bit = remaining & -remaining
+            i = bit.bit_length() - 1
+            node_in = in_masks[i] & available_in
+            node_out = out_masks[i] & available_out
+            if not (node_in and node_out):
+                return False
+            if (node_count > 2 and node_in == node_out and
+                    not node_in & (node_in - 1)):
+                # Node may only be entered from and left to the same
+                # neighbour.
+                return False
+            if symmetric and current != start:
+                # A node with only two available neighbours must be
+                # visited between them.
+                node_both = node_in | node_out
+                node_rest = node_both & (node_both - 1)
+                if not node_rest & (node_rest - 1):
+                    if node_both & current_bit:
+                        node_in = current_bit
+                    if node_both & start_bit:
+                        node_out = start_bit
+            if node_in == current_bit:
+                # Node can only be entered from the current node.
+                if forced_next:
+                    return False
+                forced_next = bit
+            if node_out == start_bit:
+                # Node can only be left to the start node.
+                if forced_last:
+                    return False
+                forced_last = bit
+            remaining ^= bit
+        if forced_next:
+            candidates = forced_next
+
+        unvisited_count = node_count - len(order)
+        if colour_mask is not None:
+            # Path from current node through unvisited nodes to the start
+            # node alternates between colours.
+            current_colour = colour_mask >> current & 1
+            if (colour_mask >> start & 1) != (current_colour ^
+                                              (unvisited_count + 1) % 2):
+                return False
+            other_colour_mask = (~colour_mask if current_colour else
+                                 colour_mask)
+            if (bin(unvisited & other_colour_mask).count('1') !=
+                    (unvisited_count + 1) // 2):
+                return False
+
+        if symmetric and current != start:
+            if not path_feasible(current, unvisited):
+                return False
+        else:
+            # Each unvisited node must be reachable from the current node.
+            reached = 0
+            frontier = out_masks[current] & unvisited
+            while frontier:
+                reached |= frontier
+                expanded = 0
+                while frontier:
+                    bit = frontier & -frontier
+                    expanded |= out_masks[bit.bit_length() - 1]
+                    frontier ^= bit
+                frontier = expanded & unvisited & ~reached
+            if reached != unvisited:
+                return False
+
+        # Try candidates with the fewest onward options first.
+        options = []
+        while candidates:
+            bit = candidates & -candidates
+            i = bit.bit_length() - 1
+            options.append((bin(out_masks[i] & unvisited).count('1'), i))
+            candidates ^= bit
+        for option_count, i in sorted(options):
+            order.append(i)
+            if search(i, unvisited ^ (1 << i)):
+                return True
+            order.pop()
+        return False
+
+    try:
+        search(start, ((1 << node_count) - 1) ^ start_bit)
+    finally:
+        count('cycles.backtrack_steps', step_count[0])
+    if not solutions:
         if not findall:
-            raise ValueError('No cycle exists between nodes.')
+            raise NoCycleError('No cycle exists between nodes.', 'exhausted')
+        return []
+    # Rotate each cycle to start at the first node.
+    solutions = sorted(order_i[order_i.index(0):] + order_i[:order_i.index(0)]
+                       for order_i in solutions)
+    solutions = [tuple(nodes[order_i]) for order_i in solutions]
+    if not findall:
+        return solutions[0]
     return solutions
 
 
+def _connected_between(nodes, connections):
+    '''
+    Return boolean matrix where $c_{i,j}$ is `True` if `nodes[i]` is connected
+    to `nodes[j]`, i.e., rows and columns are indexed by position in `nodes`.
+    '''
+    connected = connections[np.ix_(nodes, nodes)]
+    if hasattr(connected, 'toarray'):
+        # Sparse connections matrix.
+        connected = connected.toarray()
+    return np.asarray(connected) != 0
+
+
+def _bipartite_colour_mask(connected):
+    '''
+    Return bit mask of the nodes assigned the second colour in a two-colouring
+    of the (symmetric) boolean `connected` matrix, or `None` if the graph is
+    not bipartite.
+    '''
+    colours = -np.ones(connected.shape[0], dtype=int)
+    for root in xrange(connected.shape[0]):
+        if colours[root] >= 0:
+            continue
+        colours[root] = 0
+        queue = [root]
+        while queue:
+            i = queue.pop()
+            for j in np.flatnonzero(connected[i]):
+                if colours[j] < 0:
+                    colours[j] = 1 - colours[i]
+                    queue.append(j)
+                elif colours[j] == colours[i]:
+                    return None
+    return sum(1 << int(i) for i in np.flatnonzero(colours))
+
+
+def check_cycle_feasible(nodes, connections):
+    '''
+    Test necessary conditions for a cycle to exist between the provided list
+    of node indexes (for three or more nodes):
+
+     - Each node has at least two neighbours among the nodes, and can be
+       both entered and left.
+     - The nodes are connected, and stay connected after removing any one
+       node (i.e., there is no cut vertex).
+     - If the nodes can be split into two colours, with each connection
+       joining different colours (e.g., electrodes on a square grid), the
+       colour counts are equal (a cycle alternates between colours).
+
+    These conditions are much cheaper to test than a cycle search, but do
+    not guarantee that a cycle exists.
+
+    Raises `NoCycleError` (with the `reason` of the first failed condition)
+    if any condition does not hold.
+    '''
+    connected = _connected_between(np.asarray(nodes), connections)
+    if connected.shape[0] > 1:
+        np.fill_diagonal(connected, False)
+    _check_connected_feasible(connected)
+
+
+def _check_connected_feasible(connected):
+    '''
+    Test conditions of `check_cycle_feasible` for boolean matrix of
+    connections between nodes (without self connections).
+    '''
+    node_count = connected.shape[0]
+    if node_count < 3:
+        return
+
+    def reject(reason, message):
+        count('cycles.precheck_' + reason)
+        raise NoCycleError('No cycle exists between nodes: %s.' % message,
+                           reason)
+
+    undirected = connected | connected.T
+    isolated = ((undirected.sum(axis=1) < 2) | ~connected.any(axis=0) |
+                ~connected.any(axis=1))
+    if isolated.any():
+        reject('degree', 'node at position %d has fewer than two '
+               'neighbours' % np.flatnonzero(isolated)[0])
+
+    # Depth-first search, tracking the lowest discovery time reachable from
+    # each subtree (Tarjan) to find cut vertices.
+    neighbours = [np.flatnonzero(row).tolist() for row in undirected]
+    discovered = [-1] * node_count
+    low = [0] * node_count
+    discovered[0] = low[0] = 0
+    time_i = 1
+    root_children = 0
+    cut_vertex = None
+    stack = [(0, iter(neighbours[0]))]
+    while stack:
+        i, neighbours_i = stack[-1]
+        for j in neighbours_i:
+            if discovered[j] < 0:
+                discovered[j] = low[j] = time_i
+                time_i += 1
+                stack.append((j, iter(neighbours[j])))
+                break
+            low[i] = min(low[i], discovered[j])
+        else:
+            stack.pop()
+            if stack:
+                parent = stack[-1][0]
+                low[parent] = min(low[parent], low[i])
+                if parent == 0:
+                    root_children += 1
+                elif low[i] >= discovered[parent] and cut_vertex is None:
+                    cut_vertex = parent
+    if cut_vertex is None and root_children > 1:
+        cut_vertex = 0
+
+    if time_i < node_count:
+        reject('disconnected', 'node at position %d is not connected to '
+               'node at position 0' % discovered.index(-1))
+    if cut_vertex is not None:
+        reject('cut_vertex', 'removing node at position %d disconnects the '
+               'other nodes' % cut_vertex)
+
+    colour_mask = _bipartite_colour_mask(undirected)
+    if colour_mask is not None:
+        colour_count = bin(colour_mask).count('1')
+        if 2 * colour_count != node_count:
+            reject('bipartite_imbalance', 'nodes alternate between two '
+                   'colours, with %d and %d nodes of each colour' %
+                   (node_count - colour_count, colour_count))
+
+
+def get_random_state(random_state=None):
+    '''
+    Return `numpy` random number generator for `random_state`, which may be
+    `None` (i.e., unseeded), an integer seed, a `numpy.random.RandomState` or
+    a `numpy.random.Generator`.
+    '''
+    if random_state is None or isinstance(random_state, (int, long,
+                                                         np.integer)):
+        return np.random.RandomState(random_state)
+    return random_state
+
+
+def _random_integers(random_state, low, high, size):
+    if hasattr(random_state, 'integers'):
+        # `numpy.random.Generator`
+        return random_state.integers(low, high, size=size)
+    return random_state.randint(low, high, size=size)
+
+
+def _random_floats(random_state, size):
+    if hasattr(random_state, 'integers'):
+        # `numpy.random.Generator`
+        return random_state.random(size)
+    return random_state.random_sample(size)
+
+
 def find_cycle_anneal(nodes, connections, starting_temperature=1,
-                      retry_count=15, inner_num=5):
+                      retry_count=15, inner_num=5, random_state=None,
+                      callback=None, precheck=True):
     '''
     Use simple simulated annealing pass to attempt to find a permutation of the
     provided list of node indexes that form a cycle based on the connections
@@ -48,44 +493,402 @@ def find_cycle_anneal(nodes, connections, starting_temperature=1,
 
     A `ValueError` is raised if no cycle is found between the provided nodes.
     However, since the search is not exhaustive, a cycle may still actually
-    exist.
+    exist.  Unless `precheck` is `False`, cheap necessary conditions are
+    tested first, and a `NoCycleError` is raised immediately if any fails
+    (see `check_cycle_feasible`).
+
+    Each step swaps two nodes in place and only re-scores the (at most four)
+    connections affected by the swap, i.e., each step is $O(1)$.
+
+    Arguments
+    ---------
+
+     - `random_state`: Seed, `numpy.random.RandomState` or
+       `numpy.random.Generator` used to draw swaps (see `get_random_state`).
+     - `callback`: Optional function called as `callback(temperature,
+       success_ratio)` after each temperature update, e.g., to report
+       progress.
+
+    The number of swaps evaluated and accepted, temperature updates and
+    restarts are recorded as `cycles.anneal_*` counters (see
+    `metrics.record`).
 
     __NB__, The worst case runtime of this algorithm is $O(10000n)$.  Although
     this function does not guarantee a solution if one exists, it remains
     practical for $n > 10$, as opposed to the `find_cycle_enumerate` function.
     '''
-    nodes_i = np.array(nodes, dtype=int)
-    score_i = sum(test_p_fast(nodes_i, connections))
-    if score_i >= len(nodes_i):
-        return nodes_i
+    nodes = np.array(nodes, dtype=int)
+    node_count = nodes.shape[0]
+    random_state = get_random_state(random_state)
+
+    # Connections and current permutation, both in terms of positions in
+    # `nodes`.
+    connected = _connected_between(nodes, connections)
+    if precheck:
+        check_cycle_feasible(np.arange(node_count), connected)
+    connected = connected.tolist()
+    order = range(node_count)
+
+    def edge(k):
+        # Score of connection from position `k` to its right neighbour.
+        return connected[order[k]][order[(k + 1) % node_count]]
+
+    score_i = sum(edge(k) for k in xrange(node_count))
+    if score_i >= node_count:
+        return nodes
+    elif node_count < 2:
+        raise ValueError('No cycle found (score: %s) %s' % (score_i, nodes))
+    step_count = max(1, int(inner_num * node_count ** 1.333))
+    counts = {'swaps_evaluated': 0, 'swaps_accepted': 0,
+              'temperature_updates': 0, 'restarts': 0}
+
+    try:
+        for retry_i in xrange(retry_count):
+            # Restart annealing schedule (from the current permutation).
+            counts['restarts'] += retry_i > 0
+            temperature = starting_temperature
+            for i in xrange(100):
+                swaps_evaluated = 0
+                swaps_accepted = 0
+
+                # Draw random numbers for all steps at once.
+                swaps = _random_integers(random_state, 1, node_count,
+                                         (step_count, 2)).tolist()
+                rolls = _random_floats(random_state, step_count).tolist()
+
+                for (source, target), roll in itertools.izip(swaps, rolls):
+                    # Connections (by left position) affected by swap.
+                    edges = set([source - 1, source, target - 1, target])
+                    score_before = sum(edge(k) for k in edges)
+                    order[source], order[target] = (order[target],
+                                                    order[source])
+                    score_j = (score_i + sum(edge(k) for k in edges) -
+                               score_before)
+                    swaps_evaluated += 1
+                    if score_j >= node_count:
+                        counts['swaps_evaluated'] += swaps_evaluated
+                        counts['swaps_accepted'] += swaps_accepted + 1
+                        return nodes[order]
+
+                    if score_j >= score_i or roll < math.exp(.5 * (score_j -
+                                                                  score_i) /
+                                                             temperature):
+                        score_i = score_j
+                        swaps_accepted += 1
+                    else:
+                        # Revert swap.
+                        order[source], order[target] = (order[target],
+                                                        order[source])
+                counts['swaps_evaluated'] += swaps_evaluated
+                counts['swaps_accepted'] += swaps_accepted
+
+                success_ratio = swaps_accepted / float(swaps_evaluated)
+
+                if success_ratio > .96:
+                    temperature *= .5
+                elif success_ratio > .8:
+                    temperature *= .9
+                elif success_ratio > .15:
+                    temperature *= .95
+                else:
+                    temperature *= .8
+                counts['temperature_updates'] += 1
+                if callback is not None:
+                    callback(temperature, success_ratio)
+    finally:
+        for name, n in counts.iteritems():
+            count('cycles.anneal_' + name, n)
+    raise ValueError('No cycle found (score: %s) %s' % (score_i, nodes[order]))
+
+
+def find_cycle_population(nodes, connections, population_size=1024,
+                          generation_count=2000, starting_temperature=1,
+                          random_state=None, callback=None, precheck=True):
+    '''
+    Use a population of simulated annealing chains, evaluated together as
+    `numpy` arrays, to attempt to find a permutation of the provided list of
+    node indexes that form a cycle based on the connections between nodes.
+
+    The population is stored as a `(population_size, n)` array of
+    permutations, initialized by random walks along connections.  Each
+    generation applies one random mutation to every permutation: a swap of
+    two nodes, or a reversal of a segment (i.e., a 2-opt move), which for
+    half of the permutations joins the node before a break in the cycle to
+    one of its neighbours.  All mutated permutations are scored with a
+    single gather from the connections matrix, and each mutation is
+    accepted as in `find_cycle_anneal`.  Every 10 generations, the worst
+    tenth of the population is replaced by copies of the best permutations.
+
+    A `ValueError` is raised if no cycle is found within `generation_count`
+    generations.  However, since the search is not exhaustive, a cycle may
+    still actually exist.  Unless `precheck` is `False`, cheap necessary
+    conditions are tested first, and a `NoCycleError` is raised immediately
+    if any fails (see `check_cycle_feasible`).
+
+    Arguments
+    ---------
+
+     - `random_state`: Seed, `numpy.random.RandomState` or
+       `numpy.random.Generator` (see `get_random_state`).
+     - `callback`: Optional function called as `callback(temperature,
+       success_ratio, best_score)` after each generation.
+
+    The number of generations and of permutations evaluated are recorded as
+    `cycles.population_*` counters (see `metrics.record`).
+
+    __NB__, Suited to larger node sets (e.g., 30-60 nodes), where each
+    generation evaluates thousands of permutations for the Python overhead
+    of one.
+    '''
+    nodes = np.array(nodes, dtype=int)
+    node_count = nodes.shape[0]
+    random_state = get_random_state(random_state)
+    connected = _connected_between(nodes, connections)
+    if precheck:
+        check_cycle_feasible(np.arange(node_count), connected)
+    if node_count < 3:
+        # Small cycles are checked directly.
+        return find_cycle_anneal(nodes, connections, precheck=False)
+
+    def score(population):
+        return connected[population, np.roll(population, -1,
+                                             axis=1)].sum(axis=1)
+
+    rows = np.arange(population_size)[:, None]
+    positions = np.arange(node_count)
+    population = _random_walks(connected, population_size, random_state)
+    scores = score(population)
     temperature = starting_temperature
+    elite_count = max(1, population_size // 10)
+
+    try:
+        for generation_i in xrange(generation_count):
+            if scores.max() >= node_count:
+                break
+            # Mutate all permutations at once: reverse the segment between
+            # two positions (2-opt), or swap the nodes at the two positions.
+            ends = np.sort(_random_integers(random_state, 0, node_count,
+                                            (population_size, 2)), axis=1)
+            start, end = ends[:, :1], ends[:, 1:]
+            mutation = _random_floats(random_state, (population_size, 1))
+            reverse = mutation < .75
+
+            # For half of the permutations, pick the 2-opt move which joins
+            # the node before a random break in the cycle to one of its
+            # neighbours.
+            broken = ~connected[population, np.roll(population, -1, axis=1)]
+            before = (_random_floats(random_state, (population_size,
+                                                    node_count)) *
+                      broken).argmax(axis=1)
+            neighbour = (_random_floats(random_state, (population_size,
+                                                       node_count)) *
+                         connected[population[rows[:, 0], before]])\
+                .argmax(axis=1)
+            inverse = np.empty_like(population)
+            inverse[rows, population] = positions
+            after = inverse[rows[:, 0], neighbour]
+            joined = (mutation[:, 0] < .5) & (before != after)
+            start[joined, 0] = np.where(after > before, before + 1,
+                                        after + 1)[joined]
+            end[joined, 0] = np.maximum(before, after)[joined]
+            inside = (positions >= start) & (positions <= end)
+            reversed_positions = np.where(inside, start + end - positions,
+                                          positions)
+            swapped_positions = np.where(positions == start, end,
+                                         np.where(positions == end, start,
+                                                  positions))
+            mutants = population[rows, np.where(reverse, reversed_positions,
+                                                swapped_positions)]
+            mutant_scores = score(mutants)
+
+            rolls = _random_floats(random_state, population_size)
+            accepted = ((mutant_scores >= scores) |
+                        (rolls < np.exp(.5 * (mutant_scores - scores) /
+                                        temperature)))
+            population[accepted] = mutants[accepted]
+            scores[accepted] = mutant_scores[accepted]
+
+            if generation_i % 10 == 9:
+                # Replace the worst permutations with the best.
+                ranks = np.argsort(scores)
+                population[ranks[:elite_count]] = \
+                    population[ranks[-elite_count:]]
+                scores[ranks[:elite_count]] = scores[ranks[-elite_count:]]
+
+            success_ratio = accepted.mean()
+            if success_ratio > .96:
+                temperature *= .5
+            elif success_ratio > .8:
+                temperature *= .9
+            elif success_ratio > .15:
+                temperature *= .95
+            else:
+                temperature *= .8
+            # Reheat once the chains are frozen.
+            if temperature < 1e-3 * starting_temperature:
+                temperature = starting_temperature
+            if callback is not None:
+                callback(temperature, success_ratio, scores.max())
+        else:  # No break
+            generation_i = generation_count
+    finally:
+        count('cycles.population_generations', generation_i)
+        count('cycles.population_evaluations',
+              generation_i * population_size)
+
+    best = np.argmax(scores)
+    if scores[best] >= node_count:
+        return nodes[population[best]]
+    raise ValueError('No cycle found (score: %s) %s' %
+                     (scores[best], nodes[population[best]]))
+
+
+def find_cycle_anytime(nodes, connections, deadline_ms, initial=None,
+                       starting_temperature=1, warm_temperature=.05,
+                       block_size=256, random_state=None, callback=None):
+    '''
+    Search for a permutation of the provided list of node indexes that forms
+    a cycle based on the connections between nodes, for at most
+    `deadline_ms` milliseconds, and return the best permutation found.
+
+    Unlike `find_cycle_anneal`, no error is raised if no cycle is found, so
+    a caller with bounded latency (e.g., a real-time scheduler) always gets
+    an answer, which may have some broken edges (i.e., consecutive nodes
+    which are not connected).
+
+    Each step either swaps two nodes or reverses the segment between them
+    (i.e., a 2-opt move, which for a quarter of the steps joins the node
+    before a break in the cycle to one of its neighbours), and only
+    re-scores the connections affected by the move.  The position of each
+    node is tracked, so each move is evaluated in constant time (an accepted
+    reversal is applied in time proportional to the segment length).  Moves
+    are accepted as in `find_cycle_anneal`, and the temperature is raised
+    back to `starting_temperature` (or `warm_temperature`, for a warm start)
+    whenever the search freezes.  The
+    deadline is only checked after every `block_size` moves.
 
-    for retry_i in xrange(retry_count):
-        for i in xrange(100):
-            swaps_evaluated = 0
-            swaps_accepted = 0
+    Arguments
+    ---------
 
-            for j in xrange(int(inner_num * len(nodes) ** 1.333)):
-                source, target = np.random.randint(1, len(nodes_i), size=2)
-                nodes_j = nodes_i.copy()
-                nodes_j[[source, target]] = nodes_i[[target, source]]
-                connected = test_p_fast(nodes_j, connections)
-                score_j = sum(connected)
-                if score_j >= len(nodes):
-                    return nodes_j
+     - `deadline_ms`: Search time budget, in milliseconds.
+     - `initial`: Optional warm start permutation of node indexes, e.g., the
+       cycle returned by a previous call before a small change to `nodes`
+       or `connections`.  Nodes of `initial` which are not in `nodes` are
+       dropped, and nodes missing from `initial` are inserted where they
+       break the fewest connections.  By default, the search starts from a
+       random walk along connections.
+     - `warm_temperature`: Used instead of `starting_temperature` (i.e.,
+       to start from and reheat to) with a warm start.  At a low
+       temperature, moves which break connections are rarely accepted, so
+       the search repairs `initial` rather than scrambling it.
+     - `random_state`: Seed, `numpy.random.RandomState` or
+       `numpy.random.Generator` (see `get_random_state`).
+     - `callback`: Optional function called as `callback(temperature,
+       success_ratio, best_score)` after each block of moves.
 
-                keep_anyway = (np.random.rand() <
-                               np.power(np.e, (.5 * (score_j - score_i) /
-                                               temperature)))
+    Returns
+    -------
 
-                if score_j >= score_i or keep_anyway:
-                    nodes_i = nodes_j
-                    score_i = score_j
-                    swaps_accepted += 1
-                swaps_evaluated += 1
+    `(cycle, score, broken_edges)`, where `cycle` is the best permutation of
+    `nodes` found, `score` is the number of connected consecutive pairs of
+    nodes in `cycle` (including the last and first nodes), i.e., `cycle` is a
+    cycle if `score` equals the number of nodes, and `broken_edges` is the
+    list of consecutive `(node_a, node_b)` pairs which are not connected.
 
-            success_ratio = swaps_accepted / float(swaps_evaluated)
+    The number of moves evaluated and accepted, and of restarts (i.e.,
+    reheats), are recorded as `cycles.anytime_*` counters (see
+    `metrics.record`).
+    '''
+    deadline = time.time() + 1e-3 * deadline_ms
+    nodes = np.array(nodes, dtype=int)
+    node_count = nodes.shape[0]
+    random_state = get_random_state(random_state)
+    connected_array = _connected_between(nodes, connections)
+    connected = connected_array.tolist()
+    neighbours = [np.flatnonzero(row).tolist() for row in connected_array]
+
+    if initial is not None:
+        order = _warm_start_order(nodes, initial, connected_array)
+    elif node_count:
+        order = _random_walks(connected_array, 1,
+                              random_state)[0].tolist()
+    else:
+        order = []
+    # Position of each node in `order`.
+    positions = [0] * node_count
+    for k, node_k in enumerate(order):
+        positions[node_k] = k
+
+    def edge(k):
+        # Score of connection from position `k` to its right neighbour.
+        return connected[order[k % node_count]][order[(k + 1) % node_count]]
+
+    score_i = sum(edge(k) for k in xrange(node_count))
+    best = (score_i, list(order))
+    counts = {'moves_evaluated': 0, 'moves_accepted': 0, 'restarts': 0}
+    if initial is not None:
+        starting_temperature = warm_temperature
+    temperature = starting_temperature
+
+    try:
+        # All permutations of 3 or fewer nodes form the same cycle.
+        while best[0] < node_count and node_count > 3:
+            moves = _random_integers(random_state, 0, node_count,
+                                     (block_size, 2)).tolist()
+            kinds = _random_floats(random_state, block_size).tolist()
+            rolls = _random_floats(random_state, block_size).tolist()
+            moves_evaluated = 0
+            moves_accepted = 0
 
+            for (i, j), kind, roll in itertools.izip(moves, kinds, rolls):
+                if kind < .25:
+                    # Join the node before a break in the cycle to one of
+                    # its neighbours by reversing the nodes between them.
+                    if edge(i) or not neighbours[order[i]]:
+                        continue
+                    neighbours_i = neighbours[order[i]]
+                    j = positions[neighbours_i[j % len(neighbours_i)]]
+                    i, j = min(i, j) + 1, max(i, j)
+                elif i > j:
+                    i, j = j, i
+                if kind < .5:
+                    # Reverse `order[i:j + 1]`, replacing connections
+                    # `(i - 1, i)` and `(j, j + 1)` (connections are
+                    # symmetric).
+                    if j - i < 1 or j - i >= node_count - 1:
+                        continue
+                    before, after = order[i - 1], order[(j + 1) % node_count]
+                    delta = (connected[before][order[j]] +
+                             connected[order[i]][after] - edge(i - 1) -
+                             edge(j))
+                else:
+                    # Connections (by left position) affected by swap.
+                    edges = set(k % node_count for k in (i - 1, i, j - 1, j))
+                    score_before = sum(edge(k) for k in edges)
+                    order[i], order[j] = order[j], order[i]
+                    delta = sum(edge(k) for k in edges) - score_before
+                moves_evaluated += 1
+
+                if delta >= 0 or roll < math.exp(.5 * delta / temperature):
+                    if kind < .5:
+                        order[i:j + 1] = order[i:j + 1][::-1]
+                        for k in xrange(i, j + 1):
+                            positions[order[k]] = k
+                    else:
+                        positions[order[i]], positions[order[j]] = i, j
+                    score_i += delta
+                    moves_accepted += 1
+                    if score_i > best[0]:
+                        best = (score_i, list(order))
+                        if score_i >= node_count:
+                            break
+                elif kind >= .5:
+                    # Revert swap.
+                    order[i], order[j] = order[j], order[i]
+            counts['moves_evaluated'] += moves_evaluated
+            counts['moves_accepted'] += moves_accepted
+
+            success_ratio = moves_accepted / float(max(1, moves_evaluated))
             if success_ratio > .96:
                 temperature *= .5
             elif success_ratio > .8:
@@ -94,7 +897,321 @@ def find_cycle_anneal(nodes, connections, starting_temperature=1,
                 temperature *= .95
             else:
                 temperature *= .8
-            if i % 10 == 0:
-                print 'temperature: %s, success: %.2f' % (temperature,
-                                                          success_ratio)
-        raise ValueError('No cycle found (score: %s) %s' % (score_i, nodes_i))
+            # Reheat once the search is frozen.
+            if temperature < 1e-3 * starting_temperature:
+                temperature = starting_temperature
+                counts['restarts'] += 1
+            if callback is not None:
+                callback(temperature, success_ratio, best[0])
+            if time.time() >= deadline:
+                break
+    finally:
+        for name, n in counts.iteritems():
+            count('cycles.anytime_' + name, n)
+
+    score, order = best
+    cycle = nodes[order]
+    cycle_list = cycle.tolist()
+    broken_edges = [(cycle_list[k], cycle_list[(k + 1) % node_count])
+                    for k in xrange(node_count)
+                    if not connected[order[k]][order[(k + 1) % node_count]]]
+    return cycle, score, broken_edges
+
+
+def _warm_start_order(nodes, initial, connected):
+    '''
+    Return warm start permutation of positions in `nodes`, keeping the order
+    of the nodes in `initial` and inserting each missing node where it
+    breaks the fewest connections in the boolean `connected` matrix.
+    '''
+    positions = dict((node_i, k) for k, node_i in enumerate(nodes.tolist()))
+    order = []
+    for node_i in initial:
+        k = positions.pop(node_i, None)
+        if k is not None:
+            order.append(k)
+    connected = connected.astype(int)
+    for k in sorted(positions.values()):
+        if len(order) < 2:
+            order.append(k)
+            continue
+        current = np.array(order)
+        following = np.roll(current, -1)
+        gains = (connected[current, k] + connected[k, following] -
+                 connected[current, following])
+        order.insert(int(gains.argmax()) + 1, k)
+    return order
+
+
+def _random_walks(connected, walk_count, random_state):
+    '''
+    Return `(walk_count, n)` array of permutations of the positions in the
+    boolean `connected` matrix, each built by a random walk that only jumps
+    to a random unvisited node when no unvisited neighbour is left.
+    '''
+    node_count = connected.shape[0]
+    rows = np.arange(walk_count)
+    walks = np.empty((walk_count, node_count), dtype=int)
+    unvisited = np.ones((walk_count, node_count), dtype=bool)
+    current = _random_integers(random_state, 0, node_count, walk_count)
+    for k in xrange(node_count):
+        walks[:, k] = current
+        unvisited[rows, current] = False
+        # Prefer unvisited neighbours, then any unvisited node, picked at
+        # random.
+        priorities = (_random_floats(random_state, (walk_count, node_count)) +
+                      connected[current]) * unvisited
+        current = priorities.argmax(axis=1)
+    return walks
+
+
+class _AnnealStopped(Exception):
+    pass
+
+
+# Event shared with anneal worker processes (see `_init_anneal_worker`).
+_anneal_stop_event = None
+
+
+def _init_anneal_worker(stop_event):
+    global _anneal_stop_event
+
+    _anneal_stop_event = stop_event
+
+
+def _anneal_chain(args):
+    '''
+    Run `find_cycle_anneal` in a worker process, for `args` of
+    `(connected, random_state, deadline, kwargs)`.
+
+    Returns
+    -------
+
+    `(order, metrics)`, where `order` is the cycle (as positions in
+    `connected`), or `None` if no cycle was found before either the
+    `deadline` passed or the stop event of the worker was set, and `metrics`
+    holds the counters recorded by the chain (see
+    `metrics.Recorder.as_dict`).
+    '''
+    connected, random_state, deadline, kwargs = args
+
+    def stopped():
+        return ((deadline is not None and time.time() > deadline) or
+                _anneal_stop_event.is_set())
+
+    def callback(temperature, success_ratio):
+        if stopped():
+            raise _AnnealStopped()
+
+    with record() as recorder:
+        try:
+            if stopped():
+                # Skip chains started after the search is over.
+                raise _AnnealStopped()
+            order = find_cycle_anneal(np.arange(connected.shape[0]),
+                                      connected, random_state=random_state,
+                                      callback=callback, **kwargs)
+        except (ValueError, _AnnealStopped):
+            order = None
+    return order, recorder.as_dict()
+
+
+def find_cycle_anneal_parallel(nodes, connections, chain_count=None,
+                               max_workers=None, timeout=None,
+                               random_state=None, **kwargs):
+    '''
+    Run independent, differently seeded `find_cycle_anneal` chains in a pool
+    of worker processes and return the first cycle found.
+
+    Once a cycle is found (or `timeout` expires), the remaining chains are
+    stopped at their next temperature update.
+
+    A `ValueError` is raised if no chain finds a cycle between the provided
+    nodes within the `timeout`, or a `NoCycleError` if the nodes fail the
+    checks of `check_cycle_feasible` (before any chain is started).
+
+    Arguments
+    ---------
+
+     - `chain_count`: Number of annealing chains (default: `max_workers`).
+     - `max_workers`: Number of worker processes (default: number of CPUs).
+     - `timeout`: Wall-clock budget in seconds (default: no limit).
+     - `random_state`: Seed or random generator used to seed the chains (see
+       `get_random_state`).
+     - `kwargs`: Additional keyword arguments passed to
+       `find_cycle_anneal` (e.g., `retry_count`).
+
+    Counters recorded by completed chains are added to the active recorder
+    (see `metrics.record`), along with the `cycles.anneal_chains` counter.
+    '''
+    import multiprocessing
+
+    nodes = np.array(nodes, dtype=int)
+    # Only send connections between the requested nodes to the workers.
+    connected = _connected_between(nodes, connections)
+    if kwargs.pop('precheck', True):
+        check_cycle_feasible(np.arange(connected.shape[0]), connected)
+    kwargs['precheck'] = False
+    if max_workers is None:
+        max_workers = multiprocessing.cpu_count()
+    if chain_count is None:
+        chain_count = max_workers
+    seeds = _random_integers(get_random_state(random_state), 0, 2 ** 31 - 1,
+                             chain_count).tolist()
+    deadline = None if timeout is None else time.time() + timeout
+
+    # The stop event is inherited by the workers through the pool
+    # initializer, rather than served by a separate manager process.
+    stop_event = multiprocessing.Event()
+    pool = multiprocessing.Pool(max_workers, initializer=_init_anneal_worker,
+                                initargs=(stop_event, ))
+    try:
+        results = pool.imap_unordered(_anneal_chain,
+                                      [(connected, seed_i, deadline, kwargs)
+                                       for seed_i in seeds])
+        for chain_i in xrange(chain_count):
+            remaining = (None if deadline is None
+                         else max(0, deadline - time.time()))
+            try:
+                order, chain_metrics = results.next(remaining)
+            except multiprocessing.TimeoutError:
+                break
+            recorder = active_recorder()
+            if recorder is not None:
+                recorder.update(chain_metrics)
+                recorder.count('cycles.anneal_chains')
+            if order is not None:
+                return nodes[order]
+    finally:
+        # Stop running chains, and skip chains not yet started.
+        stop_event.set()
+        pool.close()
+        pool.join()
+    raise ValueError('No cycle found between nodes by %d annealing chains.' %
+                     chain_count)
+
+
+def get_connections_fingerprint(connections):
+    '''
+    Return hash (hex digest) of which nodes are connected in a dense or
+    `scipy.sparse` connections matrix.
+
+    Only non-zero entries matter, e.g., a dense integer matrix and the
+    equivalent sparse matrix have the same fingerprint.
+    '''
+    if hasattr(connections, 'tocsr'):
+        connections = connections.tocsr(copy=True)
+        connections.eliminate_zeros()
+        connections.sort_indices()
+        arrays = [connections.indptr, connections.indices]
+    else:
+        # Same arrays as for the equivalent sparse matrix.
+        connections = np.asarray(connections)
+        rows, columns = np.nonzero(connections)
+        arrays = [np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=
+                                                             connections
+                                                             .shape[0]))]),
+                  columns]
+    sha1 = hashlib.sha1(np.array(connections.shape, dtype=np.int64)
+                        .tostring())
+    for array_i in arrays:
+        sha1.update(np.asarray(array_i, dtype=np.int64).tostring())
+    return sha1.hexdigest()
+
+
+class CycleCache(object):
+    '''
+    Memoize cycles found between sets of nodes.
+
+    Results are cached in an LRU cache, keyed by the cycle solver, the
+    sorted node set and a fingerprint of the connections (see
+    `get_connections_fingerprint`), so a repeated call with the same nodes
+    in any order returns the cached cycle.
+
+    "No cycle" results are only cached if they are definitive, i.e., if the
+    solver raised a `NoCycleError` (e.g., from a failed precheck or an
+    exhausted exact search).  Other errors (e.g., `find_cycle_anneal` giving
+    up, or a timeout) are raised without being cached, since another call
+    (e.g., with other solver arguments) may still find a cycle.
+
+    Results found with a custom `test_f` (see `find_cycle_enumerate`) are
+    never cached, since it may define connections differently.
+
+    If `cache_path` is set, cached results are loaded from (JSON) file, if
+    it exists, and written back by `save`.
+    '''
+    def __init__(self, maxsize=1024, cache_path=None):
+        self.cache = LruCache(maxsize)
+        self.cache_path = cache_path
+        if cache_path is not None and os.path.exists(cache_path):
+            with open(cache_path, 'r') as input_:
+                for key, cycle, message, reason in json.load(input_):
+                    solver_name, fingerprint, nodes = key
+                    self.cache[(solver_name, fingerprint, tuple(nodes))] = \
+                        (None if cycle is None else tuple(cycle), message,
+                         reason)
+
+    def find_cycle(self, nodes, connections, solver=None, fingerprint=None,
+                   **kwargs):
+        '''
+        Find cycle between the provided list of node indexes using `solver`,
+        unless a result is already cached.
+
+        Arguments
+        ---------
+
+         - `solver`: Cycle solver function (default: `find_cycle_enumerate`).
+         - `fingerprint`: Fingerprint of `connections` (see
+           `get_connections_fingerprint`).  Computed if not set; pass it in
+           to avoid hashing the same connections matrix on every call.
+         - `kwargs`: Additional keyword arguments passed to `solver` (not
+           part of the cache key).  `findall` is not supported, and results
+           are not cached for a custom `test_f`.
+
+        Returns
+        -------
+
+        Tuple of node indexes forming a cycle, starting at `nodes[0]`.
+
+        The error raised by `solver` (e.g., a `NoCycleError`) is raised if no
+        cycle was found.
+        '''
+        if kwargs.get('findall'):
+            raise TypeError('`findall` is not supported by `CycleCache`.')
+        if solver is None:
+            solver = find_cycle_enumerate
+        if fingerprint is None:
+            fingerprint = get_connections_fingerprint(connections)
+        nodes = [int(node_i) for node_i in nodes]
+        key = (solver.__name__, fingerprint, tuple(sorted(nodes)))
+        cached = kwargs.get('test_f', test_p_fast) is test_p_fast
+        result = self.cache.get(key) if cached else None
+        if result is None:
+            try:
+                result = (tuple(int(node_i) for node_i in
+                                solver(np.array(nodes), connections,
+                                       **kwargs)), None, None)
+            except NoCycleError as exception:
+                if not cached:
+                    raise
+                result = (None, str(exception), exception.reason)
+            if cached:
+                self.cache[key] = result
+        cycle, message, reason = result
+        if cycle is None:
+            raise NoCycleError(message, reason)
+        # Rotate cycle to start at the first node.
+        start = cycle.index(nodes[0])
+        return cycle[start:] + cycle[:start]
+
+    def save(self, cache_path=None):
+        '''
+        Write cached results to (JSON) file (default: `cache_path`).
+
+        The file is written atomically (see `files.atomic_write`).
+        '''
+        if cache_path is None:
+            cache_path = self.cache_path
+        with atomic_write(cache_path, 'w') as output:
+            json.dump([[key] + list(result) for key, result in
+                       self.cache.items()], output)
@@ -1,5 +1,23 @@
-import networkx as nx
-from .connections import extract_adjacent_paths, get_adjacency_matrix
+import hashlib
+import io
+import itertools
+import os
+
+import numpy as np
+
+from .actuation import ChannelIndex
+from .connections import extract_adjacent_paths, get_path_indexes
+from .files import atomic_write
+from .graph import CsrGraph
+from .lru import LruCache
+from .metrics import stage
+from .planning import plan_moves
+from .routes import (get_affected_sources, get_route_table,
+                     remove_route_nodes, update_route_table, walk_route)
+from .tours import find_tour
+
+# __NB__ On Python 2, `pandas` imports `matplotlib`, which is slow to import,
+# so `pandas` is only imported by the functions which use it.
 
 
 def svg_polygons_to_channels(svg_source, xpath='svg:polygon',
@@ -27,56 +45,830 @@ def svg_polygons_to_channels(svg_source, xpath='svg:polygon',
             .set_index('id')['channels'])
 
 
+def svg_polygons_to_frames(svg_source):
+    '''
+    Read polygon vertices and electrode channels from an SVG in a single
+    streaming pass, clearing each element from memory once processed.
+
+    Equivalent to (but faster than) calling both
+    `svg_model.svg_polygons_to_df` and `svg_polygons_to_channels` with their
+    default arguments.
+
+    Arguments
+    ---------
+
+     - `svg_source`: A file path, URI, or file-like object.
+
+    Returns
+    -------
+
+    `(df_device, electrode_channels)`, where `df_device` is a table with one
+    row per polygon vertex (`path_id`, `vertex_i`, `x` and `y` columns), and
+    `electrode_channels` maps the id of each top-level polygon to its list of
+    channels.
+    '''
+    from lxml import etree
+    import pandas as pd
+
+    polygon_tag = '{http://www.w3.org/2000/svg}polygon'
+
+    path_ids = []
+    vertex_counts = []
+    coordinates = []
+    channel_ids = []
+    channels = []
+
+    depth = 0
+    for event, element in etree.iterparse(svg_source,
+                                          events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            continue
+        if element.tag == polygon_tag:
+            coordinates_i = np.array(element.attrib['points']
+                                     .replace(',', ' ').split(), dtype=float)
+            path_ids.append(element.attrib.get('id'))
+            vertex_counts.append(coordinates_i.shape[0] // 2)
+            coordinates.append(coordinates_i)
+            if depth == 2:
+                # Polygon is a direct child of the root element.
+                channel_ids.append(element.attrib['id'])
+                channels.append(map(int, element.attrib
+                                    .get('data-channels', '').split(',')))
+        depth -= 1
+        if element.tag == polygon_tag or depth <= 1:
+            # Release memory used by processed elements.
+            element.clear()
+            if depth == 1:
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+
+    vertex_counts = np.array(vertex_counts, dtype=int)
+    if coordinates:
+        coordinates = np.concatenate(coordinates).reshape(-1, 2)
+    else:
+        coordinates = np.zeros((0, 2))
+    path_starts = np.cumsum(vertex_counts) - vertex_counts
+    df_device = pd.DataFrame({'path_id': np.repeat(np.array(path_ids,
+                                                            dtype=object),
+                                                   vertex_counts),
+                              'vertex_i': (np.arange(coordinates.shape[0]) -
+                                           np.repeat(path_starts,
+                                                     vertex_counts)),
+                              'x': coordinates[:, 0],
+                              'y': coordinates[:, 1]},
+                             columns=['path_id', 'vertex_i', 'x', 'y'])
+    electrode_channels = pd.Series(channels, index=pd.Index(channel_ids,
+                                                            name='id'),
+                                   name='channels')
+    return df_device, electrode_channels
+
+
+def _no_path_error(message):
+    # `networkx` is only imported when needed, since it is slow to import.
+    import networkx as nx
+
+    return nx.NetworkXNoPath(message)
+
+
+ARTIFACT_FORMAT_VERSION = 1
+
+# Marks a route cache miss (a cached route may be `None`).
+_NOT_CACHED = object()
+
+
+def get_device_key(svg_data, extend=.5, **kwargs):
+    '''
+    Return content hash identifying compiled device artifact for SVG contents
+    `svg_data` processed with the specified `extend` (and any other
+    `DeviceFrames` keyword arguments).
+    '''
+    key = hashlib.sha1(svg_data)
+    key.update(repr((ARTIFACT_FORMAT_VERSION, float(extend),
+                     sorted(kwargs.items()))).encode('utf8'))
+    return key.hexdigest()
+
+
+def _frame_to_arrays(name, df):
+    '''
+    Return dictionary of `numpy` arrays encoding data frame.  Columns of
+    Python objects or categories (e.g., path ids) are stored as integer
+    codes, along with the unique values.
+    '''
+    import pandas as pd
+    from pandas.api.types import is_categorical_dtype
+
+    arrays = {'%s.index' % name: df.index.values,
+              '%s.columns' % name: np.array(df.columns.tolist())}
+    for i, column_i in enumerate(df.columns):
+        values = df[column_i].values
+        if values.dtype == object or is_categorical_dtype(values):
+            codes, uniques = pd.factorize(values)
+            arrays['%s.%d.codes' % (name, i)] = codes
+            arrays['%s.%d.uniques' % (name, i)] = np.array(uniques.tolist())
+        else:
+            arrays['%s.%d' % (name, i)] = values
+    return arrays
+
+
+def _arrays_to_frame(name, arrays):
+    '''
+    Decode data frame encoded by `_frame_to_arrays`.
+    '''
+    import pandas as pd
+
+    columns = arrays['%s.columns' % name].tolist()
+    data = {}
+    for i, column_i in enumerate(columns):
+        if '%s.%d.codes' % (name, i) in arrays:
+            uniques = np.array(arrays['%s.%d.uniques' % (name, i)].tolist(),
+                               dtype=object)
+            data[column_i] = uniques[arrays['%s.%d.codes' % (name, i)]]
+        else:
+            data[column_i] = arrays['%s.%d' % (name, i)]
+    return pd.DataFrame(data, index=arrays['%s.index' % name],
+                        columns=columns)
+
+
 # Extract [adjacency list][1] from paths data frame.
 #
 # [1]: https://en.wikipedia.org/wiki/Adjacency_list
 class DeviceFrames(object):
     def __init__(self, svg_source, **kwargs):
-        from svg_model import svg_polygons_to_df, compute_shape_centers
+        '''
+        Arguments
+        ---------
+
+         - `svg_source`: A file path or file-like object.
+         - `extend`: Absolute distance to extend each electrode outline by
+           when testing for adjacency (see
+           `connections.extract_adjacent_paths`).
+         - `route_table`: If `True`, precompute shortest routes between all
+           electrodes (see `build_route_table`).
+         - `cache_dir`: Directory of compiled device artifacts (see `save`).
+           If set, frames are loaded from the artifact for the contents of
+           `svg_source` and `extend` (if available), and otherwise saved to
+           a new artifact after processing the SVG.
+         - `route_cache_size`: Maximum number of routes cached by
+           `find_path` (default: 1024).
+
+        Remaining keyword arguments are passed to `svg_polygons_to_channels`.
 
+        The wall time of each stage (e.g., `device.svg_parse`,
+        `device.adjacency_extraction`) is recorded if called within a
+        `metrics.record` block.
+        '''
         extend = kwargs.pop('extend', .5)
-        self.electrode_channels = svg_polygons_to_channels(svg_source,
-                                                           **kwargs)
-        # Read device layout from SVG file.
-        df_device = svg_polygons_to_df(svg_source)
-        #self.df_paths = scale_svg_frame(df_device)
-        self.df_paths = compute_shape_centers(df_device, 'path_id')
-        self.df_connected = extract_adjacent_paths(self.df_paths, extend)
-        self.df_connected['cost'] = 1
-
-        # The following returns one row per electrode, indexed by electrode path id
-        self.df_path_centers = (self.df_paths.drop_duplicates(['path_id'])
-                                .set_index('path_id')[['x_center',
-                                                       'y_center']])
-        (self.adjacency_matrix, self.indexed_paths,
-         self.path_indexes) = get_adjacency_matrix(self.df_connected)
-        self.df_indexed_path_centers = (self.df_path_centers
-                                        .loc[self.path_indexes.index]
-                                        .reset_index())
-        self.df_indexed_path_centers.rename(columns={'index': 'path_id'},
-                                            inplace=True)
-
-        self.df_connected_indexed = self.df_connected.copy()
-        self.df_connected_indexed['source'] = map(str, self.path_indexes
-                                                  [self.df_connected
-                                                   ['source']])
-        self.df_connected_indexed['target'] = map(str, self.path_indexes
-                                                       [self.df_connected
-                                                        ['target']])
-
-        self.df_paths_indexed = self.df_paths.copy()
-        self.df_paths_indexed['path_id'] = map(str, self.path_indexes
-                                               [self.df_paths.path_id])
-        self.graph = nx.Graph()
-        for index, row in self.df_connected.iterrows():
-            self.graph.add_edge(row['source'], row['target'],
-                                cost=row['cost'])
+        route_table = kwargs.pop('route_table', False)
+        cache_dir = kwargs.pop('cache_dir', None)
+        route_cache_size = kwargs.pop('route_cache_size', 1024)
+
+        if cache_dir is None:
+            self._read_svg(svg_source, extend, **kwargs)
+        else:
+            if hasattr(svg_source, 'read'):
+                svg_data = svg_source.read()
+            else:
+                with open(svg_source, 'rb') as input_:
+                    svg_data = input_.read()
+            cache_path = os.path.join(cache_dir, '%s.npz' %
+                                      get_device_key(svg_data, extend,
+                                                     **kwargs))
+            if os.path.exists(cache_path):
+                self._read_artifact(cache_path)
+            else:
+                self._read_svg(io.BytesIO(svg_data), extend, **kwargs)
+                with stage('device.artifact_save'):
+                    self.save(cache_path)
+        self._index_frames(route_table, route_cache_size)
+
+    def _read_svg(self, svg_source, extend, **kwargs):
+        from svg_model import svg_polygons_to_df, compute_shape_centers
+
+        with stage('device.svg_parse'):
+            if kwargs:
+                # Custom channel polygon selection.
+                self.electrode_channels = \
+                    svg_polygons_to_channels(svg_source, **kwargs)
+                if hasattr(svg_source, 'seek'):
+                    svg_source.seek(0)
+                # Read device layout from SVG file.
+                df_device = svg_polygons_to_df(svg_source)
+            else:
+                # Read device layout and channels from SVG file in one pass.
+                df_device, self.electrode_channels = \
+                    svg_polygons_to_frames(svg_source)
+        with stage('device.shape_centers'):
+            #self.df_paths = scale_svg_frame(df_device)
+            self.df_paths = compute_shape_centers(df_device, 'path_id')
+        with stage('device.adjacency_extraction'):
+            self.df_connected = extract_adjacent_paths(self.df_paths, extend)
+            self.df_connected['cost'] = 1
+
+    def _read_artifact(self, artifact_path):
+        import pandas as pd
+
+        with stage('device.artifact_load'):
+            with open(artifact_path, 'rb') as input_:
+                arrays = dict(np.load(input_).items())
+            if arrays.pop('format_version') != ARTIFACT_FORMAT_VERSION:
+                raise ValueError('Unsupported device artifact format: %s' %
+                                 artifact_path)
+            self.df_paths = _arrays_to_frame('paths', arrays)
+            self.df_connected = _arrays_to_frame('connected', arrays)
+            channel_counts = arrays['channels.counts']
+            channel_offsets = np.concatenate([[0], np.cumsum(channel_counts)])
+            channels = arrays['channels.values'].tolist()
+            self.electrode_channels = \
+                pd.Series([channels[channel_offsets[i]:channel_offsets[i + 1]]
+                           for i in xrange(channel_counts.shape[0])],
+                          index=pd.Index(arrays['channels.index'], name='id'),
+                          name='channels')
+
+    def _index_frames(self, route_table, route_cache_size=1024):
+        with stage('device.index_frames'):
+            # Store path id of each vertex as a category code, rather than a
+            # reference to a Python string.
+            self.df_paths['path_id'] = \
+                self.df_paths['path_id'].astype('category')
+            self.indexed_paths, self.path_indexes = \
+                get_path_indexes(self.df_connected)
+
+        with stage('device.graph_build'):
+            self.csr_graph = CsrGraph(self.indexed_paths.shape[0],
+                                      self.path_indexes[self.df_connected
+                                                        ['source']].values,
+                                      self.path_indexes[self.df_connected
+                                                        ['target']].values,
+                                      self.df_connected['cost'].values)
+        # Derived views, built on first access.
+        self._adjacency_matrix = None
+        self._df_path_centers = None
+        self._df_indexed_path_centers = None
+        self._df_connected_indexed = None
+        self._df_paths_indexed = None
+        self._graph = None
+        self._channel_index = None
+        self.disabled_electrodes = set()
+        self.route_cache = LruCache(route_cache_size)
+
+        self.route_table = None
+        if route_table:
+            self.build_route_table()
+
+    def _index_codes(self, path_ids):
+        import pandas as pd
+
+        # Category of electrode index (as a string) of each path id.
+        codes = self.path_indexes.reindex(path_ids).fillna(-1).astype(int)
+        return pd.Categorical.from_codes(codes.values,
+                                         map(str, xrange(self.path_indexes
+                                                         .shape[0])))
+
+    @property
+    def adjacency_matrix(self):
+        '''
+        Dense matrix where $a_{i,j} = 1$ indicates electrode $i$ is connected
+        to electrode $j$ (see `connections.get_adjacency_matrix`).
+
+        Only built when first accessed, since its size is the square of the
+        number of electrodes.  Routing uses the `csr_graph`.
+        '''
+        if self._adjacency_matrix is None:
+            with stage('device.matrix_build'):
+                node_count = self.csr_graph.node_count
+                rows = np.repeat(np.arange(node_count),
+                                 np.diff(self.csr_graph.indptr))
+                self._adjacency_matrix = np.zeros((node_count, node_count),
+                                                  dtype=int)
+                self._adjacency_matrix[rows, self.csr_graph.indices] = 1
+        return self._adjacency_matrix
+
+    @property
+    def df_path_centers(self):
+        '''
+        Center of each electrode, indexed by electrode path id.
+        '''
+        import pandas as pd
+
+        if self._df_path_centers is None:
+            df_centers = self.df_paths.drop_duplicates(['path_id'])
+            self._df_path_centers = \
+                pd.DataFrame(df_centers[['x_center', 'y_center']].values,
+                             index=pd.Index(df_centers['path_id']
+                                            .astype(object).values,
+                                            name='path_id'),
+                             columns=['x_center', 'y_center'])
+        return self._df_path_centers
+
+    @property
+    def df_indexed_path_centers(self):
+        '''
+        Center of each electrode (with `path_id` column), indexed by
+        electrode index (see `path_indexes`).
+        '''
+        if self._df_indexed_path_centers is None:
+            df_centers = (self.df_path_centers.loc[self.path_indexes.index]
+                          .reset_index())
+            df_centers.rename(columns={'index': 'path_id'}, inplace=True)
+            self._df_indexed_path_centers = df_centers
+        return self._df_indexed_path_centers
+
+    @property
+    def df_connected_indexed(self):
+        '''
+        Copy of `df_connected` with `source` and `target` electrode ids
+        replaced by electrode indexes (as string categories).
+        '''
+        if self._df_connected_indexed is None:
+            df_connected = self.df_connected.copy()
+            df_connected['source'] = \
+                self._index_codes(self.df_connected['source'])
+            df_connected['target'] = \
+                self._index_codes(self.df_connected['target'])
+            self._df_connected_indexed = df_connected
+        return self._df_connected_indexed
+
+    @property
+    def df_paths_indexed(self):
+        '''
+        Copy of `df_paths` with path ids replaced by electrode indexes (as
+        string categories).
+        '''
+        if self._df_paths_indexed is None:
+            df_paths = self.df_paths.copy()
+            df_paths['path_id'] = self._index_codes(self.df_paths['path_id'])
+            self._df_paths_indexed = df_paths
+        return self._df_paths_indexed
+
+    @property
+    def graph(self):
+        '''
+        `networkx` graph of electrode connections, with a `cost` attribute
+        for each edge.
+
+        Only built when first accessed, since `find_path` and `path_length`
+        use the lighter `csr_graph`.  Built from `csr_graph` (rather than
+        `df_connected`, which keeps the connections of disabled electrodes),
+        with a node for every electrode.
+        '''
+        if self._graph is None:
+            import networkx as nx
+
+            with stage('device.networkx_graph_build'):
+                graph = self.csr_graph
+                sources = np.repeat(np.arange(graph.node_count),
+                                    np.diff(graph.indptr))
+                # Each connection is stored in both directions.
+                upper = sources < graph.indices
+                ids = self.indexed_paths.values
+                edges = zip(ids[sources[upper]].tolist(),
+                            ids[graph.indices[upper]].tolist(),
+                            graph.weights[upper].tolist())
+                self._graph = nx.Graph()
+                self._graph.add_nodes_from(ids.tolist())
+                self._graph.add_weighted_edges_from(edges, weight='cost')
+        return self._graph
+
+    @property
+    def channel_index(self):
+        '''
+        Electrode to channel index (see `actuation.ChannelIndex`), e.g., to
+        compile routes into channel actuation frames:
+
+            >>> path = device.find_path(source_id, target_id)
+            >>> frames = device.channel_index.compile_path(path)
+        '''
+        if self._channel_index is None:
+            self._channel_index = ChannelIndex(self.electrode_channels)
+        return self._channel_index
+
+    @classmethod
+    def load(cls, artifact_path, route_table=False, route_cache_size=1024):
+        '''
+        Load device from compiled artifact written by `save`, skipping SVG
+        processing.
+        '''
+        device = cls.__new__(cls)
+        device._read_artifact(artifact_path)
+        device._index_frames(route_table, route_cache_size)
+        return device
+
+    def save(self, artifact_path):
+        '''
+        Write compiled device artifact (i.e., electrode paths and centers,
+        connections and channel map) to an uncompressed `.npz` file.
+
+        The artifact is written atomically (see `files.atomic_write`).
+        '''
+        arrays = {'format_version': ARTIFACT_FORMAT_VERSION}
+        arrays.update(_frame_to_arrays('paths', self.df_paths))
+        arrays.update(_frame_to_arrays('connected', self.df_connected))
+        arrays['channels.index'] = \
+            np.array(self.electrode_channels.index.tolist())
+        arrays['channels.counts'] = \
+            np.array([len(c) for c in self.electrode_channels], dtype=int)
+        arrays['channels.values'] = \
+            np.array([c_ij for c in self.electrode_channels for c_ij in c],
+                     dtype=int)
+
+        with atomic_write(artifact_path) as output:
+            np.savez(output, **arrays)
+
+    def build_route_table(self):
+        '''
+        Precompute shortest routes between all pairs of electrodes (see
+        `routes.get_route_table`), so that `find_path` and `path_length` are
+        simple table look ups.
+
+        Routes can only be precomputed if all connections have the same
+        `cost`.  Otherwise, no table is built and routes are found using
+        Dijkstra's algorithm.
+
+        Returns
+        -------
+
+        `(distances, predecessors)` tables, or `None` if connection costs are
+        not uniform.
+        '''
+        costs = self.df_connected['cost'].unique()
+        if costs.shape[0] == 1:
+            self.route_cost = costs[0]
+            with stage('device.route_table'):
+                self.route_table = \
+                    get_route_table(self.csr_graph.to_csr_matrix())
+        else:
+            self.route_table = None
+        return self.route_table
+
+    def disable_electrodes(self, electrode_ids):
+        '''
+        Exclude electrodes (e.g., faulty electrodes) from routing.
+
+        The connections of each electrode are removed from the adjacency
+        matrix and routing structures, but kept in `df_connected` so they
+        can be restored by `enable_electrodes`.  Only routes through the
+        disabled electrodes are recomputed.
+        '''
+        electrode_ids = set(electrode_ids) - self.disabled_electrodes
+        self.disabled_electrodes.update(electrode_ids)
+        neighbours, weights = self.csr_graph._lists()
+        disabled = self.path_indexes[list(electrode_ids)].tolist()
+        removed = set()
+        for i in disabled:
+            removed.update((min(i, j), max(i, j)) for j in neighbours[i])
+        self._update_connections(removed=sorted(removed), disabled=disabled)
+
+    def enable_electrodes(self, electrode_ids):
+        '''
+        Restore routing through electrodes disabled by `disable_electrodes`.
+        '''
+        electrode_ids = set(electrode_ids) & self.disabled_electrodes
+        self.disabled_electrodes.difference_update(electrode_ids)
+        source = self.df_connected['source']
+        target = self.df_connected['target']
+        df_added = self.df_connected[(source.isin(electrode_ids) |
+                                      target.isin(electrode_ids)) &
+                                     ~source.isin(self.disabled_electrodes) &
+                                     ~target.isin(self.disabled_electrodes)]
+        self._update_connections(added=zip(self.path_indexes
+                                           [df_added['source']].tolist(),
+                                           self.path_indexes
+                                           [df_added['target']].tolist(),
+                                           df_added['cost'].tolist()))
+
+    def add_connection(self, source_id, target_id, cost=1):
+        '''
+        Add connection between two electrodes (both must already be in
+        `path_indexes`).
+        '''
+        import pandas as pd
+
+        i, j = self.path_indexes[[source_id, target_id]].tolist()
+        row_i = (self.df_connected.index.max() + 1
+                 if self.df_connected.shape[0] else 0)
+        self.df_connected.loc[row_i] = pd.Series({'source': source_id,
+                                                  'target': target_id,
+                                                  'cost': cost})
+        self._df_connected_indexed = None
+        if not set([source_id, target_id]) & self.disabled_electrodes:
+            self._update_connections(added=[(i, j, cost)])
+
+    def remove_connection(self, source_id, target_id):
+        '''
+        Remove connection between two electrodes.
+        '''
+        i, j = self.path_indexes[[source_id, target_id]].tolist()
+        source = self.df_connected['source']
+        target = self.df_connected['target']
+        removed = (((source == source_id) & (target == target_id)) |
+                   ((source == target_id) & (target == source_id)))
+        self.df_connected = self.df_connected.loc[~removed]
+        self._df_connected_indexed = None
+        self._update_connections(removed=[(i, j)])
+
+    def _update_connections(self, removed=(), added=(), disabled=()):
+        '''
+        Remove `(i, j)` and add `(i, j, cost)` connections (by electrode
+        index) in the adjacency matrix and routing structures.
+
+        All connections of `disabled` electrodes must be included in
+        `removed`.
+        '''
+        if self.route_table is not None:
+            if any(cost_ij != self.route_cost for i, j, cost_ij in added):
+                # Connection costs are no longer uniform.
+                self.route_table = None
+            else:
+                disabled_set = set(disabled)
+                affected = get_affected_sources(self.route_table,
+                                                [(i, j) for i, j in removed
+                                                 if i not in disabled_set and
+                                                 j not in disabled_set],
+                                                [(i, j) for i, j, cost_ij in
+                                                 added], disabled)
+
+        for i, j in removed:
+            if self._adjacency_matrix is not None:
+                self._adjacency_matrix[i, j] = self._adjacency_matrix[j, i] = 0
+            self.csr_graph.remove_edge(i, j)
+            if self._graph is not None:
+                source_id, target_id = self.indexed_paths[[i, j]]
+                if self._graph.has_edge(source_id, target_id):
+                    self._graph.remove_edge(source_id, target_id)
+        for i, j, cost_ij in added:
+            if self._adjacency_matrix is not None:
+                self._adjacency_matrix[i, j] = self._adjacency_matrix[j, i] = 1
+            self.csr_graph.add_edge(i, j, cost_ij)
+            if self._graph is not None:
+                self._graph.add_edge(*self.indexed_paths[[i, j]], cost=cost_ij)
+
+        if self.route_table is not None:
+            # Only recompute routes from sources affected by the changes.
+            remove_route_nodes(self.route_table, disabled)
+            update_route_table(self.route_table,
+                               self.csr_graph.to_csr_matrix(), affected)
+        self._evict_routes(removed, added, disabled)
+
+    def _evict_routes(self, removed=(), added=(), disabled=()):
+        '''
+        Evict cached routes (see `find_path`) which may no longer be valid or
+        shortest after the changes applied by `_update_connections`.
+
+        Routes through removed connections or disabled electrodes are
+        evicted.  Added connections only evict cached "no path" results, and
+        routes which could be shortened by the new connections, i.e., routes
+        longer than the shortest possible route through a new connection
+        (ignoring blocked electrodes).
+        '''
+        if not len(self.route_cache):
+            return
+        ids = self.indexed_paths.values
+        changed_edges = set()
+        for i, j in itertools.chain(removed, ((i, j) for i, j, cost_ij in
+                                              added)):
+            changed_edges.update([(ids[i], ids[j]), (ids[j], ids[i])])
+        disabled_ids = set(ids[i] for i in disabled)
+
+        # Distances (in the updated graph) from the ends of each added
+        # connection.
+        uniform = self.csr_graph.uniform_cost
+        distances = {}
+        path_indexes = self.path_indexes.to_dict() if added else None
+        for i, j, cost_ij in added:
+            for node_i in (i, j):
+                if node_i not in distances:
+                    distances[node_i] = self._get_distances(node_i)
+
+        stale = []
+        for key, route in self.route_cache.items():
+            if route is None:
+                if added:
+                    stale.append(key)
+                continue
+            if (disabled_ids.intersection(route) or
+                    any(edge_i in changed_edges
+                        for edge_i in itertools.izip(route[:-1],
+                                                     route[1:]))):
+                stale.append(key)
+                continue
+            if not added:
+                continue
+            nodes_i = [path_indexes[route[0]], path_indexes[route[-1]]]
+            if uniform:
+                length = len(route) - 1
+            else:
+                length = self._get_route_cost([path_indexes[id_i]
+                                               for id_i in route])
+            for i, j, cost_ij in added:
+                shortest = (min(distances[i][nodes_i[0]] +
+                                distances[j][nodes_i[1]],
+                                distances[j][nodes_i[0]] +
+                                distances[i][nodes_i[1]]) +
+                            (1 if uniform else cost_ij))
+                if shortest < length:
+                    stale.append(key)
+                    break
+        for key in stale:
+            del self.route_cache[key]
+
+    def _get_distances(self, node_i):
+        '''
+        Return array of shortest distances from electrode index `node_i` (in
+        connections if costs are uniform, otherwise in total cost), with
+        infinite distance to unreachable electrodes.
+        '''
+        if self.route_table is not None:
+            distances = self.route_table[0][node_i].astype(float)
+            distances[distances < 0] = np.inf
+            return distances
+        if self.csr_graph.uniform_cost:
+            reached = self.csr_graph.bfs(node_i)[0]
+        else:
+            reached = self.csr_graph.dijkstra(node_i)[0]
+        distances = np.full(self.csr_graph.node_count, np.inf)
+        distances[reached.keys()] = reached.values()
+        return distances
+
+    def _get_route_cost(self, route):
+        # Total cost of connections along route (of electrode indexes).
+        neighbours, weights = self.csr_graph._lists()
+        return sum(weights[a][neighbours[a].index(b)]
+                   for a, b in itertools.izip(route[:-1], route[1:]))
 
     # Returns a list of nodes on the shortest path from source to target.
-    def find_path(self, source_id, target_id):
+    def find_path(self, source_id, target_id, blocked=None):
+        '''
+        Return list of electrodes on the shortest path from source to target.
+
+        The path never passes through `blocked` electrodes (e.g., electrodes
+        occupied by other droplets), except for the source and target
+        electrodes themselves.
+
+        Paths are cached in `route_cache`, keyed by `(source_id, target_id,
+        frozenset(blocked))`, until a change of connections affects them.
+        Use `route_cache.stats()` for cache hit/miss counts.
+        '''
+        if source_id == target_id:
+            return [source_id]
+        blocked = (frozenset(blocked) - frozenset([source_id, target_id])
+                   if blocked else frozenset())
+        key = (source_id, target_id, blocked)
+        route = self.route_cache.get(key, _NOT_CACHED)
+        if route is _NOT_CACHED:
+            route = self._find_route(source_id, target_id, blocked)
+            self.route_cache[key] = route
+        if route is None:
+            raise _no_path_error('No path between %s and %s.' %
+                                 (source_id, target_id))
+        return list(route)
+
+    def _find_route(self, source_id, target_id, blocked):
+        source_i = self.path_indexes.at[source_id]
+        target_i = self.path_indexes.at[target_id]
+        blocked_i = set(self.path_indexes[list(blocked)].tolist())
+        route = None
+        if self.route_table is not None:
+            distances, predecessors = self.route_table
+            route = walk_route(predecessors, source_i, target_i)
+            if route is None:
+                # Target is not reachable, even without blocked electrodes.
+                return None
+        if route is None or blocked_i.intersection(route):
+            route = self.csr_graph.shortest_path(source_i, target_i,
+                                                 blocked=blocked_i)
+            if route is None:
+                return None
+        return tuple(self.indexed_paths.values[route].tolist())
+
+    def find_paths(self, source_id, target_ids, blocked=None):
+        '''
+        Return shortest paths from source to each target, found by a single
+        search from the source (see `find_path` for `blocked`).
+
+        Returns
+        -------
+
+        Dictionary mapping each reachable target to the list of electrodes
+        on its path.  Unreachable targets are omitted.
+        '''
+        return self._find_paths(source_id, target_ids, blocked)
+
+    def find_nearest_path(self, source_id, target_ids, blocked=None):
+        '''
+        Return nearest target (e.g., the nearest of several reservoir or
+        waste electrodes) and the path to it, found by a single search from
+        the source, which stops at the nearest target (see `find_path` for
+        `blocked`).
+
+        Returns
+        -------
+
+        `(target_id, path)`, where `path` is the list of electrodes on the
+        shortest path to `target_id`.
+        '''
+        target_ids = list(target_ids)
+        paths = self._find_paths(source_id, target_ids, blocked, nearest=True)
+        if not paths:
+            raise _no_path_error('No path between %s and any of %s.' %
+                                 (source_id,
+                                  ', '.join(map(str, target_ids))))
+        return paths.items()[0]
+
+    def plan_moves(self, moves, max_steps=None):
+        '''
+        Plan synchronized, collision-free paths for several droplets moving
+        at the same time (see `planning.plan_moves`).
+
+        Arguments
+        ---------
+
+         - `moves`: List of `(source_id, target_id)` electrode pairs, one per
+           droplet, in order of priority.
+         - `max_steps`: Maximum number of time steps.
+
+        Returns
+        -------
+
+        List of paths (one per move), each a list of electrode ids with one
+        electrode per time step.  All paths have the same length, e.g., to
+        compile with `channel_index.compile_routes`.
+        '''
+        moves_i = [(self.path_indexes.at[source_id],
+                    self.path_indexes.at[target_id])
+                   for source_id, target_id in moves]
+        routes = plan_moves(self.csr_graph, moves_i, max_steps=max_steps)
+        if routes is None:
+            raise _no_path_error('No collision-free plan found for '
+                                 'moves: %s' % (moves, ))
+        return [self.indexed_paths.values[route].tolist()
+                for route in routes]
+
+    def find_tour(self, electrode_ids):
+        '''
+        Return short closed route through all `electrode_ids` (e.g., for a
+        mixing loop), which may pass through other electrodes (see
+        `tours.find_tour`).
+
+        Returns
+        -------
+
+        List of electrode indexes (see `path_indexes`) on the route, starting
+        with the first electrode, e.g., to draw using:
+
+            >>> tour = device.find_tour(electrode_ids)
+            >>> draw_path(axis, device.df_indexed_path_centers, tour)
+
+        Use `indexed_paths[tour]` for the electrode ids.
+        '''
+        try:
+            return find_tour(self.csr_graph,
+                             [self.path_indexes.at[electrode_id]
+                              for electrode_id in electrode_ids])
+        except ValueError as exception:
+            raise _no_path_error(str(exception))
+
+    def _find_paths(self, source_id, target_ids, blocked, nearest=False):
+        target_ids = list(target_ids)
+        source_i = self.path_indexes.at[source_id]
+        targets_i = [self.path_indexes.at[target_id]
+                     for target_id in target_ids]
+        blocked_i = (set(self.path_indexes[list(blocked)].tolist())
+                     if blocked else set())
+        blocked_i.difference_update([source_i] + targets_i)
+
+        if self.route_table is not None and not blocked_i:
+            # Walk precomputed routes.
+            distances, predecessors = self.route_table
+            reached = [target_i for target_i in targets_i
+                       if distances[source_i, target_i] >= 0]
+            if nearest and reached:
+                reached = [min(reached, key=lambda target_i:
+                               distances[source_i, target_i])]
+            routes = dict((target_i, walk_route(predecessors, source_i,
+                                                target_i))
+                          for target_i in reached)
+        else:
+            routes = self.csr_graph.shortest_paths(source_i, targets_i,
+                                                   blocked=blocked_i,
+                                                   nearest=nearest)
+        return dict((self.indexed_paths.values[target_i],
+                     self.indexed_paths.values[route_i].tolist())
+                    for target_i, route_i in routes.iteritems())
+
+    # Returns the total cost of the shortest path from source to target.
+    def path_length(self, source_id, target_id):
         if source_id == target_id:
-            shortest_path = [source_id]
+            return 0
+        source_i = self.path_indexes.at[source_id]
+        target_i = self.path_indexes.at[target_id]
+        if self.route_table is not None:
+            distances, predecessors = self.route_table
+            distance = distances[source_i, target_i]
+            length = None if distance < 0 else distance * self.route_cost
         else:
-            shortest_path = nx.dijkstra_path(self.graph, source_id, target_id,
-                                             'cost')
-        return shortest_path
+            length = self.csr_graph.path_length(source_i, target_i)
+        if length is None:
+            raise _no_path_error('No path between %s and %s.' %
+                                 (source_id, target_id))
+        return length
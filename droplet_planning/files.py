@@ -0,0 +1,39 @@
+from contextlib import contextmanager
+import os
+import tempfile
+
+
+@contextmanager
+def atomic_write(path, mode='wb'):
+    '''
+    Context manager yielding file object to write the contents of `path` to.
+
+    The contents are written to a temporary file in the same directory
+    first, which replaces `path` once the block exits without error, so
+    concurrent readers never see a partially written file.  The file gets
+    the default permissions for new files (i.e., as set by the umask),
+    rather than the owner-only permissions of temporary files, e.g., so
+    processes of other users can read files in a shared directory.
+    '''
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    handle, temp_path = tempfile.mkstemp(suffix=os.path.splitext(path)[1],
+                                         dir=directory)
+    try:
+        with os.fdopen(handle, mode) as output:
+            yield output
+        os.chmod(temp_path, 0o666 & ~_get_umask())
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def _get_umask():
+    # The umask can only be read by setting it.
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
@@ -0,0 +1,322 @@
+import heapq
+
+import numpy as np
+
+
+class CsrGraph(object):
+    '''
+    Undirected graph with integer nodes $0, 1, ..., n - 1$, stored as
+    [compressed sparse row (CSR)][1] neighbour arrays.
+
+    Uses much less memory than a `networkx` graph (i.e., dictionaries of
+    dictionaries), and is much faster to build.
+
+    [1]: https://en.wikipedia.org/wiki/Sparse_matrix#Compressed_sparse_row_(CSR,_CRS_or_Yale_format)
+    '''
+    def __init__(self, node_count, source, target, cost=None):
+        '''
+        Arguments
+        ---------
+
+         - `node_count`: Number of nodes.
+         - `source`, `target`: Arrays of node indexes at either end of each
+           edge.
+         - `cost`: Array of edge costs (default: 1 for each edge).
+        '''
+        source = np.asarray(source, dtype=int)
+        target = np.asarray(target, dtype=int)
+        if cost is None:
+            cost = np.ones(source.shape[0], dtype=int)
+        cost = np.asarray(cost)
+
+        rows = np.concatenate([source, target])
+        columns = np.concatenate([target, source])
+        weights = np.concatenate([cost, cost])
+        order = np.lexsort((columns, rows))
+
+        self.node_count = node_count
+        self._arrays = (np.concatenate([[0],
+                                        np.cumsum(np.bincount(rows, minlength=
+                                                              node_count))]),
+                        columns[order], weights[order])
+        self.uniform_cost = np.unique(weights).shape[0] <= 1
+        self._uniform_weight = weights[0] if weights.shape[0] else None
+        self._neighbour_lists = None
+
+    @property
+    def indptr(self):
+        return self._csr()[0]
+
+    @property
+    def indices(self):
+        return self._csr()[1]
+
+    @property
+    def weights(self):
+        return self._csr()[2]
+
+    def neighbours(self, node):
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def _csr(self):
+        if self._arrays is None:
+            # Rebuild arrays from neighbour lists after modifications.
+            neighbours, weights = self._neighbour_lists
+            self._arrays = (np.concatenate([[0], np.cumsum([len(n) for n in
+                                                            neighbours])])
+                            .astype(int),
+                            np.array([j for n in neighbours for j in n],
+                                     dtype=int),
+                            np.array([w for w_i in weights for w in w_i]))
+        return self._arrays
+
+    def _lists(self):
+        # Python lists are much faster than `numpy` arrays to index element by
+        # element.
+        if self._neighbour_lists is None:
+            indptr = self.indptr.tolist()
+            indices = self.indices.tolist()
+            weights = self.weights.tolist()
+            self._neighbour_lists = ([indices[indptr[i]:indptr[i + 1]]
+                                      for i in xrange(self.node_count)],
+                                     [weights[indptr[i]:indptr[i + 1]]
+                                      for i in xrange(self.node_count)])
+        return self._neighbour_lists
+
+    def add_edge(self, node_i, node_j, cost=1):
+        '''
+        Add edge (or update cost of existing edge) between two nodes.
+
+        Only the neighbour lists of the two nodes are updated; the CSR
+        arrays are rebuilt on next access.
+        '''
+        neighbours, weights = self._lists()
+        for a, b in ((node_i, node_j), (node_j, node_i)):
+            if b in neighbours[a]:
+                weights[a][neighbours[a].index(b)] = cost
+            else:
+                neighbours[a].append(b)
+                weights[a].append(cost)
+        self._arrays = None
+        if self._uniform_weight is None:
+            self._uniform_weight = cost
+        elif cost != self._uniform_weight:
+            self.uniform_cost = False
+
+    def remove_edge(self, node_i, node_j):
+        '''
+        Remove edge between two nodes (if any).
+        '''
+        neighbours, weights = self._lists()
+        for a, b in ((node_i, node_j), (node_j, node_i)):
+            if b in neighbours[a]:
+                k = neighbours[a].index(b)
+                del neighbours[a][k]
+                del weights[a][k]
+        self._arrays = None
+
+    def to_csr_matrix(self):
+        '''
+        Return edge costs as a (symmetric) `scipy.sparse.csr_matrix`.
+        '''
+        from scipy.sparse import csr_matrix
+
+        return csr_matrix((self.weights, self.indices, self.indptr),
+                          shape=(self.node_count, ) * 2)
+
+    def bfs(self, source, target=None, blocked=(), targets=None,
+            target_count=None):
+        '''
+        Breadth-first search from `source`, ignoring edge costs.
+
+        Nodes in `blocked` are never entered.
+
+        Returns
+        -------
+
+        `(distances, predecessors)` dictionaries, mapping each reached node
+        to its distance (in edges) from `source` and to the previous node on
+        a shortest route from `source`.  If `target` is set, the search stops
+        once `target` is reached.  If `targets` is set, the search stops once
+        all `targets` (or `target_count` of them) are reached.
+        '''
+        neighbours, weights = self._lists()
+        targets, remaining = _get_search_targets(source, target, targets,
+                                                 target_count)
+        # Blocked nodes are treated as already visited.
+        visited = set(blocked)
+        visited.add(source)
+        distances = {source: 0}
+        predecessors = {source: None}
+        frontier = [source]
+        distance = 0
+        while frontier and remaining > 0:
+            distance += 1
+            next_frontier = []
+            for node_i in frontier:
+                for node_j in neighbours[node_i]:
+                    if node_j not in visited:
+                        visited.add(node_j)
+                        distances[node_j] = distance
+                        predecessors[node_j] = node_i
+                        next_frontier.append(node_j)
+                        if node_j in targets:
+                            remaining -= 1
+            frontier = next_frontier
+        return distances, predecessors
+
+    def dijkstra(self, source, target=None, blocked=(), targets=None,
+                 target_count=None):
+        '''
+        Dijkstra search from `source`, using edge costs.
+
+        Returns `(distances, predecessors)` dictionaries (see `bfs`).  If
+        `target` is set, the search stops once `target` is settled.  If
+        `targets` is set, the search stops once all `targets` (or
+        `target_count` of them) are settled.
+        '''
+        return self.astar(source, target, blocked=blocked, targets=targets,
+                          target_count=target_count)
+
+    def astar(self, source, target=None, heuristic=None, blocked=(),
+              targets=None, target_count=None):
+        '''
+        [A*][1] search from `source` to `target`, using edge costs.
+
+        `heuristic(node)` must never overestimate the cost of the route from
+        `node` to `target`.  Without a heuristic, this is Dijkstra's
+        algorithm.  Nodes in `blocked` are never entered.
+
+        Returns `(distances, predecessors)` dictionaries for the settled
+        nodes (see `bfs`).
+
+        [1]: https://en.wikipedia.org/wiki/A*_search_algorithm
+        '''
+        neighbours, weights = self._lists()
+        targets, remaining = _get_search_targets(source, target, targets,
+                                                 target_count)
+        if source in targets:
+            # Source is counted as reached once settled.
+            remaining += 1
+        distances = {}
+        # Blocked nodes are treated as already settled.
+        settled = set(blocked)
+        settled.discard(source)
+        predecessors = {source: None}
+        queued = {source: 0}
+        heap = [(0 if heuristic is None else heuristic(source), 0, source)]
+        while heap:
+            estimate_i, distance_i, node_i = heapq.heappop(heap)
+            if node_i in settled:
+                # Stale entry.
+                continue
+            settled.add(node_i)
+            distances[node_i] = distance_i
+            if node_i in targets:
+                remaining -= 1
+                if remaining <= 0:
+                    break
+            for node_j, weight_ij in zip(neighbours[node_i], weights[node_i]):
+                distance_j = distance_i + weight_ij
+                if node_j in settled or (node_j in queued and
+                                           queued[node_j] <= distance_j):
+                    continue
+                queued[node_j] = distance_j
+                predecessors[node_j] = node_i
+                estimate_j = (distance_j if heuristic is None
+                              else distance_j + heuristic(node_j))
+                heapq.heappush(heap, (estimate_j, distance_j, node_j))
+        return distances, dict((node_i, predecessors[node_i])
+                               for node_i in distances)
+
+    def shortest_path(self, source, target, heuristic=None, blocked=()):
+        '''
+        Return list of nodes on the shortest route from `source` to `target`
+        that does not pass through any `blocked` node, or `None` if `target`
+        is not reachable.
+
+        Uses breadth-first search if all edges have the same cost, and
+        otherwise A* search (or Dijkstra search, without a `heuristic`).
+        '''
+        if self.uniform_cost:
+            distances, predecessors = self.bfs(source, target, blocked)
+        else:
+            distances, predecessors = self.astar(source, target, heuristic,
+                                                 blocked)
+        return walk_predecessors(predecessors, target)
+
+    def shortest_paths(self, source, targets, blocked=(), nearest=False):
+        '''
+        Return shortest routes from `source` to each of `targets` (or only to
+        the nearest of `targets`, if `nearest` is `True`), found by a single
+        search, which stops once all routes (or the nearest route) are found.
+
+        Routes never pass through `blocked` nodes.  If several targets are
+        equally near, any one of them may be returned as the nearest.
+
+        Returns
+        -------
+
+        Dictionary mapping each reachable target to the list of nodes on its
+        route.
+        '''
+        targets = list(targets)
+        target_count = 1 if nearest else None
+        if self.uniform_cost:
+            distances, predecessors = self.bfs(source, blocked=blocked,
+                                               targets=targets,
+                                               target_count=target_count)
+        else:
+            distances, predecessors = self.dijkstra(source, blocked=blocked,
+                                                    targets=targets,
+                                                    target_count=target_count)
+        reached = [target_i for target_i in targets if target_i in distances]
+        if nearest and reached:
+            reached = [min(reached, key=distances.get)]
+        return dict((target_i, walk_predecessors(predecessors, target_i))
+                    for target_i in reached)
+
+    def path_length(self, source, target):
+        '''
+        Return total cost of the shortest route from `source` to `target`, or
+        `None` if `target` is not reachable.
+        '''
+        if not self.uniform_cost:
+            distances, predecessors = self.dijkstra(source, target)
+            return distances.get(target)
+        distances, predecessors = self.bfs(source, target)
+        if target not in distances:
+            return None
+        elif not distances[target]:
+            return 0
+        return distances[target] * self._uniform_weight
+
+
+def _get_search_targets(source, target, targets, target_count):
+    '''
+    Return set of search targets and the number of them left to reach before
+    a search may stop (infinite if no target is set).
+    '''
+    if target is not None:
+        targets = [target]
+    if targets is None:
+        return set(), float('inf')
+    targets = set(targets)
+    if target_count is None or target_count > len(targets):
+        target_count = len(targets)
+    return targets, target_count - (source in targets)
+
+
+def walk_predecessors(predecessors, target):
+    '''
+    Return list of nodes on route ending at `target`, following the
+    `predecessors` dictionary of a search (see `CsrGraph.bfs`), or `None` if
+    `target` was not reached.
+    '''
+    if target not in predecessors:
+        return None
+    route = [target]
+    while predecessors[route[-1]] is not None:
+        route.append(predecessors[route[-1]])
+    route.reverse()
+    return route
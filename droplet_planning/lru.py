@@ -0,0 +1,79 @@
+from collections import OrderedDict
+
+
+class LruCache(object):
+    '''
+    Dictionary-like cache holding at most `maxsize` items, evicting the least
+    recently used item first.
+
+    Counts cache hits, misses and evictions (see `stats`).
+    '''
+    def __init__(self, maxsize=1024):
+        '''
+        Arguments
+        ---------
+
+         - `maxsize`: Maximum number of cached items.  If 0, nothing is
+           cached.
+        '''
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=None):
+        '''
+        Return cached value for `key` (marking it as most recently used), or
+        `default` if `key` is not cached.
+        '''
+        try:
+            value = self._items.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self._items[key] = value
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key, value):
+        self._items.pop(key, None)
+        if self.maxsize <= 0:
+            return
+        while len(self._items) >= self.maxsize:
+            self._items.popitem(last=False)
+            self.evictions += 1
+        self._items[key] = value
+
+    def __delitem__(self, key):
+        del self._items[key]
+
+    def items(self):
+        '''
+        Return list of `(key, value)` pairs, from least to most recently
+        used (without affecting the order or statistics).
+        '''
+        return self._items.items()
+
+    def clear(self):
+        '''
+        Remove all cached items (statistics are kept).
+        '''
+        self._items.clear()
+
+    def stats(self):
+        '''
+        Returns
+        -------
+
+        Dictionary with `hits`, `misses`, `evictions`, `size` and `maxsize`.
+        '''
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'size': len(self._items),
+                'maxsize': self.maxsize}
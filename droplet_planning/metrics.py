@@ -0,0 +1,114 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+import threading
+import time
+
+
+_local = threading.local()
+
+
+class Recorder(object):
+    '''
+    Wall time of processing stages and solver counters, recorded while the
+    recorder is active (see `record`).
+
+    Stage timings are in seconds and accumulate over repeated stages, e.g.,
+    when several devices are loaded within the same `record` block.
+    '''
+    def __init__(self):
+        self.timings = OrderedDict()
+        self.counters = OrderedDict()
+
+    def add_time(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0) + seconds
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def update(self, other):
+        '''
+        Add timings and counters from another recorder (or from a dictionary
+        returned by `as_dict`).
+        '''
+        if isinstance(other, Recorder):
+            other = other.as_dict()
+        for name, seconds in other['timings'].iteritems():
+            self.add_time(name, seconds)
+        for name, n in other['counters'].iteritems():
+            self.count(name, n)
+
+    def as_dict(self):
+        '''
+        Returns
+        -------
+
+        Dictionary with `timings` (stage name to seconds) and `counters`
+        (counter name to count) dictionaries.
+        '''
+        return {'timings': dict(self.timings),
+                'counters': dict(self.counters)}
+
+
+def active_recorder():
+    '''
+    Return innermost active recorder of the current thread, or `None`.
+    '''
+    recorders = getattr(_local, 'recorders', None)
+    return recorders[-1] if recorders else None
+
+
+@contextmanager
+def record(recorder=None):
+    '''
+    Record stage timings and solver counters for the enclosed block.
+
+    For example:
+
+        >>> with record() as recorder:
+        ...     device = DeviceFrames('device.svg')
+        >>> recorder.as_dict()
+        {'counters': {}, 'timings': {'device.svg_parse': 0.01, ...}}
+
+    Arguments
+    ---------
+
+     - `recorder`: Recorder to add to (default: new `Recorder`).
+
+    __NB__, Recording is opt-in; outside of a `record` block, instrumented
+    functions do not record anything.
+    '''
+    if recorder is None:
+        recorder = Recorder()
+    if getattr(_local, 'recorders', None) is None:
+        _local.recorders = []
+    _local.recorders.append(recorder)
+    try:
+        yield recorder
+    finally:
+        _local.recorders.pop()
+
+
+@contextmanager
+def stage(name):
+    '''
+    Record wall time of the enclosed block as stage `name` (if a recorder is
+    active).
+    '''
+    recorder = active_recorder()
+    if recorder is None:
+        yield
+        return
+    start = time.time()
+    try:
+        yield
+    finally:
+        recorder.add_time(name, time.time() - start)
+
+
+def count(name, n=1):
+    '''
+    Add `n` to counter `name` (if a recorder is active).
+    '''
+    recorder = active_recorder()
+    if recorder is not None:
+        recorder.count(name, n)
@@ -0,0 +1,160 @@
+import heapq
+
+
+def plan_moves(graph, moves, max_steps=None, max_restarts=None):
+    '''
+    Plan synchronized, collision-free routes for several droplets moving at
+    the same time, using prioritized [space-time A*][1] search.
+
+    At each time step, each droplet either stays on its electrode or moves
+    to a connected electrode.  To keep droplets from merging, no two
+    droplets may ever be on the same or connected electrodes, and no
+    droplet may move next to the previous electrode of another droplet.
+
+    Droplets are planned one at a time, in order of priority, each avoiding
+    the droplets already planned and the sources of the droplets not yet
+    planned.  If a droplet cannot be planned, it is moved to the front of
+    the priority order (or to the back, if already at the front) and
+    planning starts over.
+
+    Arguments
+    ---------
+
+     - `graph`: Electrode connections, as a `graph.CsrGraph`.
+     - `moves`: List of `(source, target)` node pairs, one per droplet, in
+       order of priority.
+     - `max_steps`: Maximum number of time steps in the route of any
+       droplet (default: no limit).
+     - `max_restarts`: Maximum number of times to start over with a new
+       priority order (default: number of droplets).
+
+    Returns
+    -------
+
+    List of routes (one per move, in the same order), each a list of nodes
+    with one node per time step, padded with the target node so that all
+    routes have the same length.  Returns `None` if no plan was found.
+
+    [1]: https://en.wikipedia.org/wiki/Multi-agent_pathfinding
+    '''
+    neighbours = graph._lists()[0]
+    sources = [source for source, target in moves]
+    targets = [target for source, target in moves]
+    _check_spacing(neighbours, sources, 'sources')
+    _check_spacing(neighbours, targets, 'targets')
+    if max_restarts is None:
+        max_restarts = len(moves)
+
+    # Distance to each target (ignoring other droplets), used as heuristic.
+    target_distances = dict((target, graph.bfs(target)[0])
+                            for target in set(targets))
+
+    order = range(len(moves))
+    for restart_i in xrange(max_restarts + 1):
+        routes = {}
+        for k, move_i in enumerate(order):
+            others = [routes[move_j] for move_j in order[:k]]
+            waiting = [sources[move_j] for move_j in order[k + 1:]]
+            route = _space_time_astar(neighbours, sources[move_i],
+                                      targets[move_i],
+                                      target_distances[targets[move_i]],
+                                      others, waiting, max_steps)
+            if route is None:
+                break
+            routes[move_i] = route
+        else:  # No break
+            step_count = max(len(route) for route in routes.itervalues())
+            return [routes[move_i] + [routes[move_i][-1]] *
+                    (step_count - len(routes[move_i]))
+                    for move_i in xrange(len(moves))]
+        order.remove(move_i)
+        if k == 0:
+            # Droplet cannot move until other droplets have moved.
+            order.append(move_i)
+        else:
+            order.insert(0, move_i)
+    return None
+
+
+def _closed_neighbourhood(neighbours, node):
+    return set(neighbours[node]) | set([node])
+
+
+def _check_spacing(neighbours, nodes, name):
+    occupied = set()
+    for node_i in nodes:
+        if node_i in occupied:
+            raise ValueError('Droplet %s are too close together (at %s).' %
+                             (name, node_i))
+        occupied |= _closed_neighbourhood(neighbours, node_i)
+
+
+def _space_time_astar(neighbours, source, target, distances, others,
+                      waiting, max_steps):
+    '''
+    Return route (one node per time step) from `source` to `target`, which
+    keeps clear of the `others` routes and of the `waiting` droplets, or
+    `None` if there is no such route.
+
+    `distances` maps each node to its distance to `target`.
+    '''
+    if source not in distances:
+        return None
+
+    # Nodes each droplet must keep clear of at each time step, until all
+    # other droplets have stopped (the `horizon`).
+    static = set()
+    for node_i in waiting:
+        static |= _closed_neighbourhood(neighbours, node_i)
+    horizon = max([len(route) - 1 for route in others] + [0])
+    forbidden = []
+    last_forbidden = {}
+    for t in xrange(horizon + 1):
+        forbidden_t = set(static)
+        for route in others:
+            forbidden_t |= _closed_neighbourhood(neighbours,
+                                                 route[min(t, len(route) -
+                                                           1)])
+        forbidden.append(forbidden_t)
+        for node_i in forbidden_t:
+            last_forbidden[node_i] = t
+    if target in forbidden[-1]:
+        # Target is never clear.
+        return None
+    # Droplet may only stop on the target once the target stays clear.
+    arrival = last_forbidden.get(target, -1) + 1
+
+    # Search states are `(node, time)`.  After the horizon, states only
+    # differ by node.
+    parents = {(source, 0): None}
+    seen = set([(source, 0)])
+    heap = [(distances[source], distances[source], 0, source)]
+    while heap:
+        estimate, distance, t, node_i = heapq.heappop(heap)
+        if node_i == target and t >= arrival:
+            route = [node_i]
+            state = parents[(node_i, t)]
+            while state is not None:
+                route.append(state[0])
+                state = parents[state]
+            route.reverse()
+            return route
+        if max_steps is not None and t >= max_steps:
+            continue
+        forbidden_t = forbidden[min(t, horizon)]
+        forbidden_next = forbidden[min(t + 1, horizon)]
+        if node_i in forbidden_next:
+            # Another droplet moves next to this droplet.
+            continue
+        for node_j in neighbours[node_i] + [node_i]:
+            if (node_j in forbidden_next or node_j in forbidden_t or
+                    node_j not in distances):
+                continue
+            key = (node_j, min(t + 1, horizon + 1))
+            if key in seen:
+                continue
+            seen.add(key)
+            parents[(node_j, t + 1)] = (node_i, t)
+            heapq.heappush(heap, (t + 1 + distances[node_j],
+                                  distances[node_j], t + 1, node_j))
+    return None
@@ -1,12 +1,10 @@
 import re
 
-from matplotlib.lines import Line2D
-from matplotlib.patches import Polygon
-import matplotlib.pyplot as plt
-import networkx as nx
 import numpy as np
-import pandas as pd
-from svg_model.data_frame import close_paths
+
+# __NB__ `matplotlib` and `networkx` are slow to import (and, on Python 2,
+# `pandas` imports `matplotlib`), so they are only imported by the functions
+# which use them.
 
 
 def get_path_colors(path_colors, df_connected):
@@ -14,6 +12,9 @@ def get_path_colors(path_colors, df_connected):
     Determine polygon colors using `networkx` graph coloring algorithm.  This
     ensures that no two adjacent polygons are colored the same color.
     '''
+    import networkx as nx
+    import pandas as pd
+
     G = nx.Graph()
     G.add_edges_from(df_connected.values.tolist())
     color_map = pd.Series(nx.coloring.greedy_color(G, interchange=True))
@@ -21,43 +22,62 @@ def get_path_colors(path_colors, df_connected):
     return pd.Series(map_colors[color_map], index=color_map.index)
 
 
+def get_path_vertices(df_paths):
+    '''
+    Return list of unique path ids (in order of first appearance) and list of
+    `(n, 2)` vertex arrays, one per path (ordered by `vertex_i`).
+    '''
+    import pandas as pd
+
+    codes, path_ids = pd.factorize(df_paths['path_id'])
+    order = np.lexsort((df_paths['vertex_i'].values, codes))
+    counts = np.bincount(codes, minlength=path_ids.shape[0])
+    vertices = np.split(df_paths[['x', 'y']].values[order],
+                        np.cumsum(counts)[:-1])
+    return path_ids, vertices
+
+
 def plot_paths(df_paths, path_colors=None, labelsize=8, axis=None,
                draw_centers=False):
     '''
     Draw polygon paths from table of vertices (one row per vertex).
 
+    All polygons are drawn as a single `PolyCollection`.
+
     Arguments
     ---------
 
      - `df_paths`: Table of polygon path vertices (one row per vertex).
          * Table rows with the same value in the `path_id` column are grouped
            together as a polygon.
+     - `labelsize`: Font size of electrode labels.  Set to `None` (or 0) to
+       skip drawing labels, which is much faster for large devices.
     '''
+    from matplotlib.collections import PolyCollection
+    import matplotlib.pyplot as plt
+    import pandas as pd
+
     if axis is None:
         # Create blank axis to draw on.
         fig, axis = plt.subplots(figsize=(10, 10))
         axis.set_aspect(True)
 
+    path_ids, vertices = get_path_vertices(df_paths)
+
     if path_colors is None:
         # Get reference to cycling color generator.
         colors = axis._get_lines.color_cycle
 
         # Assign a color to each path identifier.
-        path_ids = df_paths.path_id.unique()
         path_colors = pd.Series([colors.next()
                                  for i in xrange(path_ids.shape[0])],
                                 index=path_ids)
 
     # Draw electrode paths
-    for path_id, path_i in close_paths(df_paths).groupby('path_id'):
-        color = path_colors[path_id]
-        #linewidth = 2
-        #edge = Polygon(path_i[['x', 'y']].values, edgecolor=color, closed=True,
-                       #linewidth=linewidth, facecolor='none')
-        face = Polygon(path_i[['x', 'y']].values, edgecolor='none',
-                       closed=True, facecolor=color, alpha=.45)
-#         axis.add_patch(edge)
-        axis.add_patch(face)
+    faces = PolyCollection(vertices, edgecolors='none', closed=True,
+                           facecolors=path_colors[path_ids].tolist(),
+                           alpha=.45)
+    axis.add_collection(faces)
 
         # Set limits of axis view to device boundaries.
     axis.set_xlim(df_paths.x.min(), df_paths.x.max())
@@ -69,9 +89,10 @@ def plot_paths(df_paths, path_colors=None, labelsize=8, axis=None,
     if draw_centers:
         axis.scatter(path_centers.x_center, path_centers.y_center)
     if labelsize:
-        for i, path_i in path_centers.iterrows():
-            axis.text(path_i.x_center, path_i.y_center,
-                      re.sub(r'[A-Za-z]*', '', path_i.path_id),
+        for x_i, y_i, path_id_i in zip(path_centers.x_center.values,
+                                       path_centers.y_center.values,
+                                       path_centers.path_id.values):
+            axis.text(x_i, y_i, re.sub(r'[A-Za-z]*', '', path_id_i),
                       fontsize=labelsize)
 
     axis.set_xlabel('mm')
@@ -84,6 +105,8 @@ def draw_device(df_paths, df_connected, axis=None, **kwargs):
     Draw device using `networkx` graph coloring algorithm.  This ensures that
     no two adjacent polygons are colored the same color.
     '''
+    import matplotlib.pyplot as plt
+
     if axis is None:
         # Create blank axis to draw on.
         fig, axis = plt.subplots(figsize=(18, 10))
@@ -108,25 +131,33 @@ def draw_device(df_paths, df_connected, axis=None, **kwargs):
 def draw_connections(df_paths, df_connected, color=None, axis=None):
     '''
     Draw the connections in the provided adjacency list.
+
+    All connections are drawn as a single `LineCollection` between the centers
+    of the connected paths.
     '''
+    from matplotlib.collections import LineCollection
+    import matplotlib.pyplot as plt
+
     if axis is None:
         # Create blank axis to draw on.
         fig, axis = plt.subplots(figsize=(18, 10))
         axis.set_aspect(True)
 
-    # Get reference to cycling color generator.
-    colors = axis._get_lines.color_cycle
+    path_centers = (df_paths.drop_duplicates(['path_id'])
+                    .set_index('path_id')[['x_center', 'y_center']])
+    target_column = ('destination' if 'destination' in df_connected
+                     else 'target')
 
     #Draws the connections
-    for index, row in df_connected.iterrows():
-        path_current = df_paths[df_paths.path_id == row['source']]
-        path_adjacent = df_paths[df_paths.path_id == row['destination']]
-
-        path_current = path_current.append(path_adjacent)
-        poly = Polygon(path_current[['x_center','y_center']].values,
-                       edgecolor=colors.next() if color is None else color,
-                       facecolor='none', alpha=.4, linewidth=5)
-        axis.add_patch(poly)
+    segments = np.stack([path_centers.loc[df_connected['source']].values,
+                         path_centers.loc[df_connected[target_column]]
+                         .values], axis=1)
+    if color is None:
+        # Get reference to cycling color generator.
+        colors = axis._get_lines.color_cycle
+        color = [colors.next() for i in xrange(segments.shape[0])]
+    lines = LineCollection(segments, colors=color, alpha=.4, linewidth=5)
+    axis.add_collection(lines)
     return axis
 
 
@@ -134,6 +165,8 @@ def draw_path(axis, df_indexed_path_centers, cycle, color='white'):
     '''
     Draw (closed) cycle of points.
     '''
+    from matplotlib.lines import Line2D
+
     points = (df_indexed_path_centers.loc[list(cycle), ['x_center', 'y_center']])
     line = Line2D(points.x_center, points.y_center, color=color, linewidth=5)
     axis.add_line(line)
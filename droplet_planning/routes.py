@@ -0,0 +1,174 @@
+import numpy as np
+
+
+def get_route_table(adjacency_matrix, chunk_size=256):
+    '''
+    Compute the shortest (i.e., fewest connections) route between every pair
+    of polygons in an adjacency matrix using a breadth-first search from each
+    polygon.
+
+    Arguments
+    ---------
+
+     - `adjacency_matrix`: Dense or `scipy.sparse` adjacency matrix (see
+       `connections.get_adjacency_matrix`).
+     - `chunk_size`: Number of source polygons to search at once.  Limits the
+       size of intermediate (floating point) results.
+
+    Returns
+    -------
+
+    `(distances, predecessors)`, where:
+
+     - `distances[i, j]` is the number of connections on the shortest route
+       from polygon $i$ to polygon $j$, or -1 if $j$ is not reachable.
+     - `predecessors[i, j]` is the polygon before polygon $j$ on the shortest
+       route from polygon $i$, or -1 if there is no such polygon.
+
+    Both are stored using the smallest signed integer type that can index all
+    polygons.
+    '''
+    node_count = adjacency_matrix.shape[0]
+    dtype = np.int16 if node_count < np.iinfo(np.int16).max else np.int32
+
+    distances = np.empty((node_count, node_count), dtype=dtype)
+    predecessors = np.empty((node_count, node_count), dtype=dtype)
+    update_route_table((distances, predecessors), adjacency_matrix,
+                       np.arange(node_count), chunk_size=chunk_size)
+    return distances, predecessors
+
+
+def update_route_table(route_table, adjacency_matrix, sources,
+                       chunk_size=256):
+    '''
+    Recompute (in place) the rows of a route table (see `get_route_table`)
+    for the specified `sources`, e.g., after changes to the adjacency matrix.
+    '''
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import breadth_first_order
+
+    distances, predecessors = route_table
+    graph = csr_matrix(adjacency_matrix)
+    node_count = graph.shape[0]
+    sources = np.asarray(sources, dtype=int)
+    for start in xrange(0, sources.shape[0], chunk_size):
+        indices = sources[start:start + chunk_size]
+        predecessors_i = np.empty((indices.shape[0], node_count), dtype=int)
+        orders = []
+        for k, source_k in enumerate(indices):
+            # Adjacency matrix is symmetric, so a directed search avoids
+            # converting the matrix on each call.
+            order_k, predecessors_i[k] = \
+                breadth_first_order(graph, source_k, directed=True,
+                                    return_predecessors=True)
+            orders.append(order_k)
+        np.maximum(predecessors_i, -1, out=predecessors_i)
+        predecessors[indices] = predecessors_i
+        distances[indices] = _get_depths(orders, predecessors_i)
+
+
+def _get_depths(orders, predecessors):
+    '''
+    Return depth of each node in the breadth-first search tree of each
+    source (one row per source), or -1 for unreachable nodes.
+
+    Arguments
+    ---------
+
+     - `orders`: List of breadth-first order of reached nodes (starting with
+       the source), one per row of `predecessors`.
+     - `predecessors`: Predecessor of each node, one row per source.
+    '''
+    row_count, node_count = predecessors.shape
+    lengths = np.array([order_k.shape[0] for order_k in orders], dtype=int)
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    order_all = np.concatenate(orders)
+    # Flat index of each reached node in a `(row_count, node_count)` array.
+    flat_all = np.repeat(np.arange(row_count) * node_count, lengths)
+    flat_all += order_all
+
+    # Position of each reached node in the concatenated orders, and position
+    # of its parent.  In breadth-first order, parent positions never
+    # decrease, so each tree level is a range of positions that can be found
+    # with `searchsorted` (for all rows at once).
+    positions = np.zeros(row_count * node_count, dtype=int)
+    positions[flat_all] = np.arange(order_all.shape[0])
+    parents = predecessors.ravel()[flat_all]
+    parent_positions = positions[flat_all - order_all +
+                                 np.maximum(parents, 0)]
+    # Source (root) of each row.
+    parent_positions[starts] = starts - 1
+
+    # Mark first position of each level (after the root level).
+    level_starts = np.zeros(order_all.shape[0] + 1, dtype=int)
+    level_start = starts
+    while True:
+        level_start = np.minimum(np.searchsorted(parent_positions, level_start,
+                                                 side='left'), ends)
+        active = level_start < ends
+        if not active.any():
+            break
+        level_starts[level_start[active]] += 1
+
+    depths_all = np.cumsum(level_starts[:-1])
+    depths_all -= np.repeat(depths_all[starts], lengths)
+    depths = -np.ones(row_count * node_count, dtype=int)
+    depths[flat_all] = depths_all
+    return depths.reshape(row_count, node_count)
+
+
+def get_affected_sources(route_table, removed_edges=(), added_edges=(),
+                         removed_nodes=()):
+    '''
+    Return array of sources whose routes (see `get_route_table`) may change
+    after removing and/or adding the specified `(i, j)` connections, or after
+    removing all connections of the specified nodes.
+
+     - A removed connection only affects sources with a route through it.
+     - A removed node only affects sources with a route *through* it; other
+       sources only lose their route *to* it (see `remove_route_nodes`).
+     - An added connection only affects sources whose distances to either
+       end of the connection differ by more than one connection.
+    '''
+    distances, predecessors = route_table
+    affected = np.zeros(distances.shape[0], dtype=bool)
+    for i, j in removed_edges:
+        affected |= (predecessors[:, j] == i) | (predecessors[:, i] == j)
+    for i in removed_nodes:
+        affected |= (predecessors == i).any(axis=1)
+    for i, j in added_edges:
+        distances_i = distances[:, i].astype(int)
+        distances_j = distances[:, j].astype(int)
+        affected |= (((distances_i < 0) != (distances_j < 0)) |
+                     (np.abs(distances_i - distances_j) > 1))
+    return np.flatnonzero(affected)
+
+
+def remove_route_nodes(route_table, nodes):
+    '''
+    Mark (in place) the specified nodes as unreachable from all other nodes.
+    '''
+    distances, predecessors = route_table
+    for i in nodes:
+        distances[:, i] = -1
+        predecessors[:, i] = -1
+        distances[i, i] = 0
+
+
+def walk_route(predecessors, source_i, target_i):
+    '''
+    Return list of polygon indexes on the shortest route from `source_i` to
+    `target_i`, following the `predecessors` table from `get_route_table`.
+
+    Returns `None` if `target_i` is not reachable from `source_i`.
+    '''
+    route = [target_i]
+    predecessors_i = predecessors[source_i]
+    while route[-1] != source_i:
+        previous_i = int(predecessors_i[route[-1]])
+        if previous_i < 0:
+            return None
+        route.append(previous_i)
+    route.reverse()
+    return route
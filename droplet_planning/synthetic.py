@@ -0,0 +1,148 @@
+'''
+Generate synthetic device layouts, e.g., for benchmarks.
+'''
+import numpy as np
+
+# __NB__ On Python 2, `pandas` imports `matplotlib`, which is slow to import,
+# so `pandas` is only imported by the functions which use it.
+
+
+def grid_shape(electrode_count):
+    '''
+    Return `(rows, columns)` of the most square grid with at least
+    `electrode_count` electrodes.
+    '''
+    columns = int(np.ceil(np.sqrt(electrode_count)))
+    rows = int(np.ceil(electrode_count / float(columns)))
+    return rows, columns
+
+
+def polygons_to_frame(polygons, path_ids=None):
+    '''
+    Return table of polygon path vertices (one row per vertex) in the format
+    produced by `svg_model.compute_shape_centers`, i.e., with `path_id`,
+    `vertex_i`, `x`, `y`, `x_center`, `y_center`, `x_center_offset` and
+    `y_center_offset` columns.
+
+    Arguments
+    ---------
+
+     - `polygons`: List of `(n, 2)` vertex arrays.
+     - `path_ids`: List of path ids (default: `electrode000`, ...).
+    '''
+    import pandas as pd
+
+    if path_ids is None:
+        path_ids = ['electrode%03d' % i for i in xrange(len(polygons))]
+    counts = np.array([len(p) for p in polygons], dtype=int)
+    vertices = np.concatenate(polygons).astype(float)
+    starts = np.cumsum(counts) - counts
+
+    # Center of each path bounding box.
+    x_min = np.minimum.reduceat(vertices[:, 0], starts)
+    x_max = np.maximum.reduceat(vertices[:, 0], starts)
+    y_min = np.minimum.reduceat(vertices[:, 1], starts)
+    y_max = np.maximum.reduceat(vertices[:, 1], starts)
+    x_center = np.repeat(.5 * (x_min + x_max), counts)
+    y_center = np.repeat(.5 * (y_min + y_max), counts)
+
+    return pd.DataFrame({'path_id': np.repeat(np.array(path_ids,
+                                                       dtype=object),
+                                              counts),
+                         'vertex_i': (np.arange(vertices.shape[0]) -
+                                      np.repeat(starts, counts)),
+                         'x': vertices[:, 0], 'y': vertices[:, 1],
+                         'x_center': x_center, 'y_center': y_center,
+                         'x_center_offset': vertices[:, 0] - x_center,
+                         'y_center_offset': vertices[:, 1] - y_center},
+                        columns=['path_id', 'vertex_i', 'x', 'y', 'x_center',
+                                 'y_center', 'x_center_offset',
+                                 'y_center_offset'])
+
+
+def square_grid_paths(electrode_count, size=2., gap=.1):
+    '''
+    Return vertex table (see `polygons_to_frame`) of square electrodes laid
+    out on a grid.
+    '''
+    rows, columns = grid_shape(electrode_count)
+    i, j = np.divmod(np.arange(electrode_count), columns)
+    corners = np.array([[0, 0], [1, 0], [1, 1], [0, 1]], dtype=float) * size
+    origins = np.column_stack([j, i]) * (size + gap)
+    return polygons_to_frame(list(origins[:, None, :] + corners))
+
+
+def hex_grid_paths(electrode_count, radius=1., gap=.1):
+    '''
+    Return vertex table (see `polygons_to_frame`) of hexagonal electrodes
+    laid out on a (pointy top) hexagonal grid.
+    '''
+    rows, columns = grid_shape(electrode_count)
+    i, j = np.divmod(np.arange(electrode_count), columns)
+    width = np.sqrt(3) * radius + gap
+    centers = np.column_stack([(j + .5 * (i % 2)) * width,
+                               i * .75 * (2 * radius + gap)])
+    angles = np.pi / 6 + np.arange(6) * np.pi / 3
+    corners = radius * np.column_stack([np.cos(angles), np.sin(angles)])
+    return polygons_to_frame(list(centers[:, None, :] + corners))
+
+
+def irregular_paths(electrode_count, size=2., gap=.1, seed=0):
+    '''
+    Return vertex table (see `polygons_to_frame`) of electrodes with varying
+    sizes and vertex counts, laid out on a grid with varying row heights and
+    column widths.
+    '''
+    random_state = np.random.RandomState(seed)
+    rows, columns = grid_shape(electrode_count)
+    widths = size * random_state.uniform(.5, 2, size=columns)
+    heights = size * random_state.uniform(.5, 2, size=rows)
+    x_starts = np.concatenate([[0], np.cumsum(widths + gap)[:-1]])
+    y_starts = np.concatenate([[0], np.cumsum(heights + gap)[:-1]])
+
+    polygons = []
+    for k in xrange(electrode_count):
+        i, j = divmod(k, columns)
+        x0, y0, w, h = x_starts[j], y_starts[i], widths[j], heights[i]
+        # Rectangle outline with extra vertices along random edges.
+        outline = [(x0, y0), (x0 + w, y0), (x0 + w, y0 + h), (x0, y0 + h)]
+        polygon = []
+        for (xa, ya), (xb, yb) in zip(outline, outline[1:] + outline[:1]):
+            polygon.append((xa, ya))
+            for t in np.sort(random_state.uniform(size=random_state
+                                                  .randint(0, 3))):
+                polygon.append((xa + t * (xb - xa), ya + t * (yb - ya)))
+        polygons.append(np.array(polygon))
+    return polygons_to_frame(polygons)
+
+
+LAYOUTS = {'square': square_grid_paths, 'hex': hex_grid_paths,
+           'irregular': irregular_paths}
+
+
+def paths_to_svg(df_paths, output=None):
+    '''
+    Write polygons from vertex table as SVG, with one `svg:polygon` per path
+    and one channel per polygon (in the `data-channels` attribute).
+
+    Returns SVG document as a string if `output` is `None`.  Otherwise,
+    `output` may be a file path or file-like object.
+    '''
+    lines = ['<svg xmlns="http://www.w3.org/2000/svg">']
+    for channel_i, (path_id, df_i) in enumerate(df_paths
+                                                .groupby('path_id',
+                                                         sort=False)):
+        points = ' '.join('%r,%r' % (x, y)
+                          for x, y in df_i.sort_values('vertex_i')
+                          [['x', 'y']].values)
+        lines.append('  <polygon id="%s" data-channels="%d" points="%s"/>' %
+                     (path_id, channel_i, points))
+    lines.append('</svg>')
+    svg = '\n'.join(lines) + '\n'
+    if output is None:
+        return svg
+    elif hasattr(output, 'write'):
+        output.write(svg)
+    else:
+        with open(output, 'w') as output_:
+            output_.write(svg)
@@ -0,0 +1,215 @@
+import numpy as np
+
+from .graph import walk_predecessors
+
+
+def find_tour(graph, nodes, exact_max=12):
+    '''
+    Find short closed route visiting all required `nodes`, which may pass
+    through other nodes (unlike `cycles.find_cycle_anneal`, which requires
+    consecutive nodes to be connected).
+
+    The distance (i.e., number of connections) between each pair of required
+    nodes is found by a breadth-first search from each required node.  The
+    order of the required nodes is then found as the solution to a
+    [travelling salesman problem][1]: exactly (using the Held-Karp dynamic
+    program) for up to `exact_max` nodes, and otherwise using nearest
+    insertion, improved by 2-opt and Or-opt moves.
+
+    Arguments
+    ---------
+
+     - `graph`: Electrode connections, as a `graph.CsrGraph`.
+     - `nodes`: Required nodes.
+     - `exact_max`: Maximum number of required nodes to order exactly.
+
+    Returns
+    -------
+
+    List of nodes on the closed route, starting at `nodes[0]`, where each
+    node is connected to the next (and the last to the first), e.g., to
+    draw with `plot.draw_path`.
+
+    Raises `ValueError` if the required nodes are not all connected.
+
+    [1]: https://en.wikipedia.org/wiki/Travelling_salesman_problem
+    '''
+    # Remove duplicates, keeping order.
+    nodes = [node_i for k, node_i in enumerate(nodes)
+             if node_i not in nodes[:k]]
+    if len(nodes) < 2:
+        return list(nodes)
+
+    searches = [graph.bfs(node_i, targets=nodes) for node_i in nodes]
+    distances = np.empty((len(nodes), len(nodes)))
+    for k, (distances_k, predecessors_k) in enumerate(searches):
+        for m, node_m in enumerate(nodes):
+            if node_m not in distances_k:
+                raise ValueError('No route between nodes %s and %s.' %
+                                 (nodes[k], node_m))
+            distances[k, m] = distances_k[node_m]
+
+    if len(nodes) <= exact_max:
+        order = get_tour_order_exact(distances)
+    else:
+        order = get_tour_order(distances)
+
+    # Expand each leg of the tour into the route between its nodes.
+    tour = []
+    for k, m in zip(order, order[1:] + order[:1]):
+        tour.extend(walk_predecessors(searches[k][1], nodes[m])[:-1])
+    return tour
+
+
+def get_tour_order_exact(distances):
+    '''
+    Return shortest closed tour (as a list of node indexes starting at 0)
+    for a `distances` matrix, using the [Held-Karp][1] dynamic program.
+
+    Runtime is $O(2^n n^2)$, i.e., only suitable for small numbers of nodes.
+
+    [1]: https://en.wikipedia.org/wiki/Held%E2%80%93Karp_algorithm
+    '''
+    node_count = distances.shape[0]
+    if node_count < 3:
+        return range(node_count)
+    # `lengths[mask, j]` is the length of the shortest path from node 0
+    # through the nodes `1 + i` for each bit `i` set in `mask`, ending at
+    # node `1 + j` (which must be in `mask`).
+    others = distances[1:, 1:]
+    count = node_count - 1
+    lengths = np.full((1 << count, count), np.inf)
+    parents = np.zeros((1 << count, count), dtype=int)
+    bits = 1 << np.arange(count)
+    lengths[bits, np.arange(count)] = distances[0, 1:]
+    for mask in xrange(1, 1 << count):
+        # Extend the paths ending at each node in `mask` to each node not in
+        # `mask`.
+        extended = lengths[mask][:, None] + others
+        best = extended.argmin(axis=0)
+        free = np.flatnonzero((mask & bits) == 0)
+        masks = mask | bits[free]
+        values = extended[best[free], free]
+        improved = values < lengths[masks, free]
+        lengths[masks[improved], free[improved]] = values[improved]
+        parents[masks[improved], free[improved]] = best[free[improved]]
+
+    full = (1 << count) - 1
+    j = int((lengths[full] + distances[1:, 0]).argmin())
+    order = []
+    mask = full
+    while mask:
+        order.append(1 + j)
+        mask, j = mask & ~bits[j], parents[mask, j]
+    return [0] + order[::-1]
+
+
+def get_tour_order(distances):
+    '''
+    Return short closed tour (as a list of node indexes starting at 0) for a
+    `distances` matrix.
+
+    The tour is built by [nearest insertion][1], and then improved by
+    [2-opt][2] and [Or-opt][3] moves until no move shortens it.  Each pass
+    evaluates all moves of a kind at once, as `numpy` arrays.
+
+    [1]: https://en.wikipedia.org/wiki/Travelling_salesman_problem#Heuristic_and_approximation_algorithms
+    [2]: https://en.wikipedia.org/wiki/2-opt
+    [3]: https://en.wikipedia.org/wiki/Travelling_salesman_problem#k-opt_heuristic,_or_Lin%E2%80%93Kernighan_heuristics
+    '''
+    order = _nearest_insertion(distances)
+    while _improve_2opt(distances, order) or _improve_or_opt(distances,
+                                                             order):
+        pass
+    # Rotate tour to start at node 0.
+    start = order.index(0)
+    return order[start:] + order[:start]
+
+
+def _nearest_insertion(distances):
+    node_count = distances.shape[0]
+    order = [0]
+    # Distance from each node to the closest node in the tour.
+    closest = distances[0].astype(float)
+    closest[0] = np.inf
+    for k in xrange(node_count - 1):
+        node_i = int(closest.argmin())
+        tour = np.array(order)
+        # Insert node between the tour nodes where it adds the least length.
+        added = (distances[tour, node_i] + distances[node_i,
+                                                     np.roll(tour, -1)] -
+                 distances[tour, np.roll(tour, -1)])
+        order.insert(int(added.argmin()) + 1, node_i)
+        closest = np.minimum(closest, distances[node_i])
+        closest[order] = np.inf
+    return order
+
+
+def _improve_2opt(distances, order):
+    '''
+    Apply the best (i.e., most shortening) 2-opt move to tour `order` (in
+    place).  Returns `True` if the tour was shortened.
+    '''
+    if len(order) < 4:
+        return False
+    a = np.array(order)
+    b = np.roll(a, -1)
+    # Replacing edges `(a[i], b[i])` and `(a[j], b[j])` by `(a[i], a[j])`
+    # and `(b[i], b[j])` reverses the tour between `b[i]` and `a[j]`.
+    gains = (distances[a, b][:, None] + distances[a, b][None, :] -
+             distances[a[:, None], a[None, :]] -
+             distances[b[:, None], b[None, :]])
+    gains[np.tril_indices(a.shape[0], 1)] = 0
+    i, j = np.unravel_index(gains.argmax(), gains.shape)
+    if gains[i, j] <= 1e-9:
+        return False
+    order[i + 1:j + 1] = order[i + 1:j + 1][::-1]
+    return True
+
+
+def _improve_or_opt(distances, order, max_segment=3):
+    '''
+    Apply the best Or-opt move (i.e., moving a segment of up to
+    `max_segment` consecutive nodes, possibly reversed, to another edge of
+    the tour) to tour `order` (in place).  Returns `True` if the tour was
+    shortened.
+    '''
+    node_count = len(order)
+    a = np.array(order)
+    b = np.roll(a, -1)
+    edge_lengths = distances[a, b]
+    positions = np.arange(node_count)
+    best = (1e-9, None)
+    for length in xrange(1, min(max_segment, node_count - 2) + 1):
+        # Segment `k` is `a[k:k + length]` (wrapping around).
+        first = a
+        last = np.roll(a, 1 - length)
+        before = np.roll(a, 1)
+        after = np.roll(a, -length)
+        removed = (distances[before, first] + distances[last, after] -
+                   distances[before, after])
+        for reverse in (False, True):
+            head, tail = (last, first) if reverse else (first, last)
+            # Cost of inserting segment `k` into edge `(a[e], b[e])`.
+            inserted = (distances[a[None, :], head[:, None]] +
+                        distances[tail[:, None], b[None, :]] -
+                        edge_lengths[None, :])
+            gains = removed[:, None] - inserted
+            # Edges touching the segment are not valid insertion points.
+            offsets = (positions[None, :] - positions[:, None]) % node_count
+            gains[(offsets >= node_count - 1) | (offsets < length)] = -np.inf
+            k, e = np.unravel_index(gains.argmax(), gains.shape)
+            if gains[k, e] > best[0]:
+                best = (gains[k, e], (k, e, length, reverse))
+    if best[1] is None:
+        return False
+    k, e, length, reverse = best[1]
+    rotated = order[k:] + order[:k]
+    segment = rotated[:length]
+    if reverse:
+        segment = segment[::-1]
+    rest = rotated[length:]
+    # Edge `e` starts at `order[e]`, i.e., `rest[(e - k) % n - length]`.
+    position = (e - k) % node_count - length + 1
+    order[:] = rest[:position] + segment + rest[position:]
+    return True
@@ -0,0 +1,123 @@
+import numpy as np
+import pytest
+
+from droplet_planning import cycles
+from droplet_planning.connections import (extract_adjacent_paths,
+                                          get_adjacency_matrix)
+from droplet_planning.cycles import (CycleCache, NoCycleError,
+                                     find_cycle_anytime, find_cycle_enumerate)
+from droplet_planning.metrics import record
+from droplet_planning.synthetic import (grid_shape, hex_grid_paths,
+                                        square_grid_paths)
+
+
+def _test_permutations(nodes, connections):
+    # Same test as `cycles.test_p_fast`, but a different function, so
+    # `find_cycle_enumerate` tests every permutation instead of delegating to
+    # `find_cycle_backtrack`.
+    return cycles.test_p_fast(nodes, connections)
+
+
+def _random_connections(random_state, node_count, density, symmetric):
+    connections = random_state.rand(node_count, node_count) < density
+    if symmetric:
+        connections = np.triu(connections, 1)
+        connections |= connections.T
+    return connections.astype(int)
+
+
+def _find_cycles(nodes, connections, test_f):
+    try:
+        return [tuple(int(node_i) for node_i in cycle_i)
+                for cycle_i in find_cycle_enumerate(nodes, connections,
+                                                    test_f=test_f,
+                                                    findall=True)]
+    except NoCycleError:
+        return []
+
+
+def test_backtrack_matches_permutations():
+    random_state = np.random.RandomState(0)
+    for trial_i in xrange(300):
+        node_count = random_state.randint(8, 12)
+        connections = _random_connections(random_state, node_count,
+                                          random_state.uniform(.2, .8),
+                                          symmetric=trial_i % 3 > 0)
+        nodes = random_state.permutation(node_count)[:random_state
+                                                     .randint(1, 8)]
+        expected = _find_cycles(nodes, connections, _test_permutations)
+        assert (_find_cycles(nodes, connections, cycles.test_p_fast) ==
+                expected)
+
+        # Otherwise, any one of the cycles is returned.
+        try:
+            cycle = tuple(int(node_i) for node_i in
+                          find_cycle_enumerate(nodes, connections))
+        except NoCycleError:
+            assert expected == []
+        else:
+            assert cycle in expected
+
+
+def test_backtrack_hex_blocks():
+    # Electrodes on a hexagonal grid have up to six neighbours, so (unlike
+    # square grids) colours do not prune the search.
+    rows, columns = grid_shape(400)
+    adjacency_matrix, indexed_paths, path_indexes = \
+        get_adjacency_matrix(extract_adjacent_paths(hex_grid_paths(400)))
+    for block_rows, block_columns in ((5, 6), (5, 8), (2, 20)):
+        nodes = path_indexes[['electrode%03d' % (i * columns + j)
+                              for i in xrange(block_rows)
+                              for j in xrange(block_columns)]].values
+        with record() as recorder:
+            cycle = find_cycle_enumerate(nodes, adjacency_matrix)
+        assert sorted(cycle) == sorted(nodes)
+        assert all(cycles.test_p_fast(list(cycle), adjacency_matrix))
+        assert (recorder.counters['cycles.backtrack_steps'] <
+                10 * nodes.shape[0])
+
+
+def test_anytime_warm_start_after_small_change():
+    # Find a cycle through an 8x8 block of a square grid, then break one of
+    # its connections (not at a corner, which has only two neighbours).
+    # Continuing from the previous cycle must repair it with fewer moves than
+    # a search from scratch.
+    rows, columns = grid_shape(400)
+    adjacency_matrix, indexed_paths, path_indexes = \
+        get_adjacency_matrix(extract_adjacent_paths(square_grid_paths(400)))
+    adjacency_matrix = np.array(adjacency_matrix)
+    nodes = path_indexes[['electrode%03d' % (i * columns + j)
+                          for i in xrange(8) for j in xrange(8)]].values
+    cycle = find_cycle_enumerate(nodes, adjacency_matrix)
+    degrees = adjacency_matrix[np.ix_(nodes, nodes)].sum(axis=1)
+    inner = [k for k in xrange(nodes.shape[0] - 1)
+             if (degrees[nodes.tolist().index(cycle[k])] > 2 and
+                 degrees[nodes.tolist().index(cycle[k + 1])] > 2)]
+    moves = {}
+    for initial in (cycle, None):
+        with record() as recorder:
+            for seed in xrange(3):
+                connections = adjacency_matrix.copy()
+                a, b = cycle[inner[7 * seed]], cycle[inner[7 * seed] + 1]
+                connections[a, b] = connections[b, a] = 0
+                cycle_i, score, broken_edges = \
+                    find_cycle_anytime(nodes, connections, 500,
+                                       initial=initial, random_state=seed)
+                if initial is not None:
+                    assert not broken_edges
+        moves[initial is None] = \
+            recorder.counters['cycles.anytime_moves_evaluated']
+    assert moves[False] < moves[True]
+
+
+def test_cycle_cache_skips_custom_test_f():
+    # A custom `test_f` may define connections differently, so its results
+    # must not be returned for the default test.
+    def _never_connected(nodes, connections):
+        return [False] * len(nodes)
+
+    connections = 1 - np.eye(4, dtype=int)
+    cache = CycleCache()
+    with pytest.raises(NoCycleError):
+        cache.find_cycle(range(4), connections, test_f=_never_connected)
+    assert cache.find_cycle(range(4), connections) == (0, 1, 2, 3)
@@ -0,0 +1,94 @@
+import io
+
+import networkx as nx
+import numpy as np
+import pytest
+
+from droplet_planning.device import DeviceFrames
+from droplet_planning.synthetic import paths_to_svg, square_grid_paths
+
+
+def _grid_device(electrode_count, **kwargs):
+    svg = paths_to_svg(square_grid_paths(electrode_count))
+    return DeviceFrames(io.BytesIO(svg), **kwargs)
+
+
+def test_graph_excludes_disabled_electrodes():
+    # The `networkx` graph must not depend on whether it was built before
+    # or after disabling electrodes.
+    for build_first in (True, False):
+        device = _grid_device(9)
+        if build_first:
+            device.graph
+        device.disable_electrodes(['electrode004'])
+        assert device.graph.degree('electrode004') == 0
+        assert device.graph.number_of_edges() == 8
+        device.enable_electrodes(['electrode004'])
+        assert device.graph.degree('electrode004') == 4
+
+
+@pytest.mark.parametrize('route_table', [False, True])
+@pytest.mark.parametrize('weighted', [False, True])
+def test_find_path_after_connection_changes(route_table, weighted):
+    # Cached routes (and the route table) must stay shortest after random
+    # changes to connections.  Repeat the same queries after each change, so
+    # that routes cached before the change are returned.
+    random_state = np.random.RandomState(0)
+    device = _grid_device(36, route_table=route_table)
+    ids = device.indexed_paths.tolist()
+    reference = nx.Graph()
+    reference.add_weighted_edges_from(device.df_connected
+                                      [['source', 'target', 'cost']]
+                                      .values.tolist(), weight='cost')
+    disabled = set()
+    queries = [tuple(random_state.choice(ids, 2, replace=False)) +
+               (frozenset(random_state.choice(ids, random_state
+                                              .choice([0, 3]),
+                                              replace=False)), )
+               for k in xrange(40)]
+
+    for step_i in xrange(60):
+        for source_id, target_id, blocked in queries:
+            if set([source_id, target_id]) & disabled:
+                continue
+            excluded = (blocked | disabled) - set([source_id, target_id])
+            graph = reference.subgraph(set(ids) - excluded)
+            try:
+                expected = nx.shortest_path_length(graph, source_id,
+                                                   target_id, weight='cost')
+            except nx.NetworkXNoPath:
+                expected = None
+            try:
+                path = device.find_path(source_id, target_id,
+                                        blocked=blocked)
+            except nx.NetworkXNoPath:
+                assert expected is None
+                continue
+            assert path[0] == source_id and path[-1] == target_id
+            assert not excluded.intersection(path)
+            assert (sum(graph[a][b]['cost'] for a, b in zip(path[:-1],
+                                                            path[1:])) ==
+                    expected)
+
+        action = random_state.choice(['disable', 'enable', 'add', 'remove'])
+        if action == 'disable':
+            electrode_id = random_state.choice(ids)
+            device.disable_electrodes([electrode_id])
+            disabled.add(electrode_id)
+        elif action == 'enable' and disabled:
+            electrode_id = sorted(disabled)[random_state
+                                            .randint(len(disabled))]
+            device.enable_electrodes([electrode_id])
+            disabled.discard(electrode_id)
+        elif action == 'add':
+            source_id, target_id = random_state.choice(ids, 2, replace=False)
+            cost = random_state.choice([1, 2]) if weighted else 1
+            device.add_connection(source_id, target_id, cost=cost)
+            reference.add_edge(source_id, target_id, cost=cost)
+        elif action == 'remove' and reference.number_of_edges():
+            source_id, target_id = \
+                list(reference.edges())[random_state
+                                        .randint(reference
+                                                 .number_of_edges())]
+            device.remove_connection(source_id, target_id)
+            reference.remove_edge(source_id, target_id)
@@ -0,0 +1,22 @@
+import os
+import shutil
+import tempfile
+
+from droplet_planning.files import atomic_write
+
+
+def test_atomic_write_uses_umask_permissions():
+    # Temporary files are created readable by the owner only, but written
+    # files must be readable as any other new file, e.g., by processes of
+    # other users sharing a cache directory.
+    directory = tempfile.mkdtemp(prefix='droplet-planning-')
+    umask = os.umask(0o022)
+    try:
+        path = os.path.join(directory, 'device.npz')
+        with atomic_write(path) as output:
+            output.write(b'data')
+        assert os.stat(path).st_mode & 0o777 == 0o644
+        assert os.listdir(directory) == ['device.npz']
+    finally:
+        os.umask(umask)
+        shutil.rmtree(directory)
@@ -0,0 +1,26 @@
+import subprocess
+import sys
+
+
+def _check_in_subprocess(source):
+    # Run in a new interpreter, since modules imported by other tests stay in
+    # `sys.modules`.
+    subprocess.check_call([sys.executable, '-c', source])
+
+
+def test_device_import_skips_matplotlib():
+    _check_in_subprocess("import droplet_planning.device, sys; "
+                         "assert 'matplotlib' not in sys.modules")
+
+
+def test_module_imports_skip_matplotlib():
+    for module in ('plot', 'synthetic', 'cycles', 'planning', 'tours'):
+        _check_in_subprocess("import droplet_planning.%s, sys; "
+                             "assert 'matplotlib' not in sys.modules" %
+                             module)
+
+
+def test_package_import_is_lazy():
+    _check_in_subprocess("import droplet_planning, sys; "
+                         "assert 'droplet_planning.device' not in "
+                         "sys.modules; assert 'pandas' not in sys.modules")